@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+
+"""Assy/Part structure as a (virtual) Qt model, an alternative to TreeView.
+
+TreeView (a QTreeWidget) holds one QTreeWidgetItem per part, all made
+and expanded when a STEP file is loaded. AssyTreeModel instead holds the
+structure as plain lists of uids, and only hands rows to the view as
+they are shown: the children of a node become rows when it is first
+expanded (see fetchMore), in batches of FETCH_SIZE. The check state of
+each part & workplane is held in the model too. The check state of an
+assembly is derived from counts of its checked leaves, kept up to date
+along its ancestors, so it costs nothing to display.
+"""
+
+import logging
+from PyQt5.QtCore import (Qt, QAbstractItemModel, QMimeData, QModelIndex,
+                          pyqtSignal)
+from PyQt5.QtGui import QBrush
+from PyQt5.QtWidgets import QAbstractItemView, QMenu, QTreeView
+
+logger = logging.getLogger(__name__)
+
+ROOT = -1  # uid of the (invisible) root, parent of the root assembly (uid 0)
+FETCH_SIZE = 500  # rows handed to the view at a time
+MIME_TYPE = 'application/x-cadviewer-uids'
+
+
+class AssyNode():
+    """Row of the model (made when handed to the view)."""
+    __slots__ = ('uid', 'row')
+
+    def __init__(self, uid, row):
+        self.uid = uid
+        self.row = row
+
+class AssyTreeModel(QAbstractItemModel):
+    """Assemblies, parts & workplanes by uid. Assemblies hold children."""
+
+    # part & workplane uids checked (True) or unchecked by the user
+    checkStateChanged = pyqtSignal(list, bool)
+    nodesMoved = pyqtSignal(list, int)  # uids moved, uid of new parent
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.clear()
+
+    def clear(self):
+        self.beginResetModel()
+        self._children = {ROOT: []}  # k = assy uid, v = list of child uids
+        self._parent = {}  # k = uid, v = parent uid
+        self._names = {}  # k = uid, v = name
+        self._checked = set()  # uids of checked leaves (parts & workplanes)
+        self._leafCount = {ROOT: 0}  # k = assy uid, v = leaves below
+        self._checkedCount = {ROOT: 0}  # k = assy uid, v = checked leaves below
+        self._fetched = {ROOT: 0}  # k = assy uid, v = children handed to view
+        self._nodes = {}  # k = uid, v = AssyNode (of rows handed to view)
+        self._background = {}  # k = uid, v = QColor
+        self.endResetModel()
+
+    # Structure
+
+    def addNode(self, uid, parentUid, name, assy=False, checked=False):
+        """Add node (uid) as last child of assembly (parentUid)."""
+        siblings = self._children[parentUid]
+        self._parent[uid] = parentUid
+        self._names[uid] = name
+        if assy:
+            self._children[uid] = []
+            self._leafCount[uid] = 0
+            self._checkedCount[uid] = 0
+            self._fetched[uid] = 0
+        visible = self.isShown(parentUid) and self._fetched[parentUid] == len(siblings)
+        if visible:  # all siblings are rows, so this one is too
+            row = len(siblings)
+            self.beginInsertRows(self.indexOf(parentUid), row, row)
+        siblings.append(uid)
+        if visible:
+            self._fetched[parentUid] += 1
+            self.endInsertRows()
+        if not assy:
+            if checked:
+                self._checked.add(uid)
+            self.addCounts(parentUid, 1, 1 if checked else 0)
+
+    def addCounts(self, uid, leaves, checked):
+        """Add to leaf counts of assembly (uid) and of its ancestors."""
+        while uid != ROOT:
+            self._leafCount[uid] += leaves
+            self._checkedCount[uid] += checked
+            self.changed(uid)
+            uid = self._parent[uid]
+
+    def __contains__(self, uid):
+        return uid in self._parent
+
+    def isAssy(self, uid):
+        return uid in self._children and uid != ROOT
+
+    def children(self, uid):
+        """Return list of uids of the children of uid (don't modify it)."""
+        return self._children.get(uid, [])
+
+    def parentUID(self, uid):
+        return self._parent[uid]
+
+    def name(self, uid):
+        return self._names[uid]
+
+    def setName(self, uid, name):
+        self._names[uid] = name
+        self.changed(uid)
+
+    def leaves(self, uid):
+        """Return uids of the parts & workplanes in (or of) node (uid)."""
+        leaves = []
+        stack = [uid]
+        while stack:
+            uid = stack.pop()
+            if uid in self._children:
+                stack.extend(self._children[uid])
+            else:
+                leaves.append(uid)
+        return leaves
+
+    def moveNode(self, uid, parentUid, row=-1):
+        """Move node (uid) to row of assembly (parentUid) (-1: to the end).
+
+        Return False if the move is not allowed (node into itself)."""
+        ancestor = parentUid
+        while ancestor != ROOT:
+            if ancestor == uid:
+                return False
+            ancestor = self._parent[ancestor]
+        oldParentUid = self._parent[uid]
+        siblings = self._children[oldParentUid]
+        newSiblings = self._children[parentUid]
+        oldRow = siblings.index(uid)
+        if row < 0 or row > len(newSiblings):
+            row = len(newSiblings)
+        if parentUid == oldParentUid and row in (oldRow, oldRow + 1):
+            return True
+        srcShown = self.isShown(oldParentUid) and oldRow < self._fetched[oldParentUid]
+        dstShown = self.isShown(parentUid) and row <= self._fetched[parentUid]
+        if srcShown and dstShown:
+            self.beginMoveRows(self.indexOf(oldParentUid), oldRow, oldRow,
+                               self.indexOf(parentUid), row)
+        elif srcShown:
+            self.beginRemoveRows(self.indexOf(oldParentUid), oldRow, oldRow)
+        elif dstShown:
+            self.beginInsertRows(self.indexOf(parentUid), row, row)
+        if uid in self._children:
+            leaves, checked = self._leafCount[uid], self._checkedCount[uid]
+        else:
+            leaves, checked = 1, 1 if uid in self._checked else 0
+        self.addCounts(oldParentUid, -leaves, -checked)
+        del siblings[oldRow]
+        if srcShown:
+            self._fetched[oldParentUid] -= 1
+        if parentUid == oldParentUid and row > oldRow:
+            row -= 1
+        newSiblings.insert(row, uid)
+        if dstShown:
+            self._fetched[parentUid] += 1
+        self._parent[uid] = parentUid
+        self.addCounts(parentUid, leaves, checked)
+        self.renumber(oldParentUid)
+        if parentUid != oldParentUid:
+            self.renumber(parentUid)
+        if srcShown and dstShown:
+            self.endMoveRows()
+        elif srcShown:
+            self.endRemoveRows()
+        elif dstShown:
+            self.endInsertRows()
+        if not dstShown:  # no longer a row, nor are the nodes below it
+            self.forgetRows(uid)
+        return True
+
+    def renumber(self, parentUid):
+        """Update the rows of the nodes of children of parentUid."""
+        for row, uid in enumerate(self._children[parentUid]):
+            node = self._nodes.get(uid)
+            if node is not None:
+                node.row = row
+
+    def forgetRows(self, uid):
+        """Forget which children of node (uid), and below, were rows.
+
+        (AssyNodes are kept, as the view may still refer to them)"""
+        stack = [uid]
+        while stack:
+            uid = stack.pop()
+            if self._fetched.get(uid):
+                self._fetched[uid] = 0
+                stack.extend(self._children[uid])
+
+    # Check state & background
+
+    def isChecked(self, uid):
+        return uid in self._checked
+
+    def checkState(self, uid):
+        if uid in self._children:
+            checked = self._checkedCount[uid]
+            if not checked:
+                return Qt.Unchecked
+            return Qt.Checked if checked == self._leafCount[uid] else Qt.PartiallyChecked
+        return Qt.Checked if uid in self._checked else Qt.Unchecked
+
+    def setChecked(self, uids, checked):
+        """Set check state of parts & workplanes (uids). Return those changed."""
+        changed = []
+        for uid in uids:
+            if (uid in self._checked) != checked and uid in self._parent:
+                if checked:
+                    self._checked.add(uid)
+                else:
+                    self._checked.discard(uid)
+                self.changed(uid)
+                self.addCounts(self._parent[uid], 0, 1 if checked else -1)
+                changed.append(uid)
+        return changed
+
+    def setBackground(self, uid, color):
+        """Set background color (QColor or None) of node (uid)."""
+        if color is None:
+            self._background.pop(uid, None)
+        else:
+            self._background[uid] = color
+        self.changed(uid)
+
+    def changed(self, uid):
+        """Have the view show node (uid) anew, if it is shown."""
+        node = self._nodes.get(uid)
+        if node is not None and self.isShown(uid):
+            index = self.createIndex(node.row, 0, node)
+            self.dataChanged.emit(index, index)
+
+    # QAbstractItemModel
+
+    def isShown(self, uid):
+        """Return True if the view has a row for node (uid)."""
+        while uid != ROOT:
+            node = self._nodes.get(uid)
+            parentUid = self._parent[uid]
+            if node is None or node.row >= self._fetched[parentUid]:
+                return False
+            uid = parentUid
+        return True
+
+    def indexOf(self, uid):
+        if uid == ROOT:
+            return QModelIndex()
+        node = self._nodes.get(uid)
+        if node is None:  # not yet asked for by the view (see index)
+            row = self._children[self._parent[uid]].index(uid)
+            node = self._nodes[uid] = AssyNode(uid, row)
+        return self.createIndex(node.row, 0, node)
+
+    def uidOf(self, index):
+        return index.internalPointer().uid if index.isValid() else ROOT
+
+    def index(self, row, column, parent=QModelIndex()):
+        parentUid = self.uidOf(parent)
+        if column != 0 or not 0 <= row < self._fetched.get(parentUid, 0):
+            return QModelIndex()
+        uid = self._children[parentUid][row]
+        node = self._nodes.get(uid)
+        if node is None:
+            node = self._nodes[uid] = AssyNode(uid, row)
+        return self.createIndex(row, 0, node)
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parentUid = self._parent[index.internalPointer().uid]
+        if parentUid == ROOT:
+            return QModelIndex()
+        return self.indexOf(parentUid)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return self._fetched.get(self.uidOf(parent), 0)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        return bool(self._children.get(self.uidOf(parent)))
+
+    def canFetchMore(self, parent):
+        uid = self.uidOf(parent)
+        return uid in self._children and self._fetched[uid] < len(self._children[uid])
+
+    def fetchMore(self, parent):
+        uid = self.uidOf(parent)
+        first = self._fetched[uid]
+        last = min(first + FETCH_SIZE, len(self._children[uid])) - 1
+        self.beginInsertRows(parent, first, last)
+        self._fetched[uid] = last + 1
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        uid = index.internalPointer().uid
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            return self._names[uid]
+        if role == Qt.CheckStateRole:
+            return self.checkState(uid)
+        if role == Qt.BackgroundRole:
+            color = self._background.get(uid)
+            return QBrush(color) if color is not None else None
+        if role == Qt.ToolTipRole:
+            return "uid %i" % uid
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        """Check (or uncheck) a node clicked by the user."""
+        if role != Qt.CheckStateRole or not index.isValid():
+            return False
+        uid = index.internalPointer().uid
+        if uid in self._children:  # assembly: (un)check all its leaves
+            checked = self.checkState(uid) != Qt.Checked
+        else:
+            checked = value == Qt.Checked
+        changed = self.setChecked(self.leaves(uid), checked)
+        if changed:
+            self.checkStateChanged.emit(changed, checked)
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemIsDropEnabled
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+        uid = index.internalPointer().uid
+        if uid in self._children:
+            flags |= Qt.ItemIsDropEnabled
+        if uid != 0:  # the root assembly stays put
+            flags |= Qt.ItemIsDragEnabled
+        return flags
+
+    def supportedDropActions(self):
+        return Qt.MoveAction
+
+    def mimeTypes(self):
+        return [MIME_TYPE]
+
+    def mimeData(self, indexes):
+        data = QMimeData()
+        uids = [str(self.uidOf(index)) for index in indexes if index.isValid()]
+        data.setData(MIME_TYPE, ' '.join(uids).encode())
+        return data
+
+    def dropMimeData(self, data, action, row, column, parent):
+        """Move the dragged nodes to row of the assembly dropped on."""
+        if action != Qt.MoveAction or not data.hasFormat(MIME_TYPE):
+            return False
+        parentUid = self.uidOf(parent)
+        if parentUid not in self._children:
+            return False
+        uids = [int(uid) for uid in bytes(data.data(MIME_TYPE)).split()]
+        moved = []
+        for uid in uids:
+            if not self.moveNode(uid, parentUid, row):
+                logger.info("Can't move %i into itself", uid)
+                continue
+            moved.append(uid)
+            if row >= 0:
+                row = self._children[parentUid].index(uid) + 1
+        if moved:
+            self.nodesMoved.emit(moved, parentUid)
+        return False  # rows are moved here: the view mustn't remove them
+
+class AssyTreeView(QTreeView):
+    """View of an AssyTreeModel, with the pop-up menu of TreeView."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.header().setHidden(True)
+        self.setUniformRowHeights(True)  # needed to scroll large trees fast
+        self.setSelectionMode(self.ExtendedSelection)
+        self.setDragDropMode(QAbstractItemView.InternalMove)
+        self.setDragEnabled(True)
+        self.setDropIndicatorShown(True)
+        self.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.customContextMenuRequested.connect(self.contextMenu)
+        self.popMenu = QMenu(self)
+
+    def contextMenu(self, point):
+        action = self.popMenu.exec_(self.mapToGlobal(point))
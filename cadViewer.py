@@ -25,7 +25,7 @@
 import logging
 import math
 import sys
-from PyQt5.QtWidgets import QApplication, QMenu, QTreeWidgetItemIterator
+from PyQt5.QtWidgets import QApplication, QMenu
 from PyQt5.QtGui import QIcon, QPixmap
 from OCC.Core.BRep import BRep_Tool
 from OCC.Core.BRepAlgoAPI import BRepAlgoAPI_Cut, BRepAlgoAPI_Fuse
@@ -930,19 +930,12 @@ def printActPart():
 
 def printTreeView():
     """Print 'uid'; 'name'; 'parent' for all items in treeView."""
-    iterator = QTreeWidgetItemIterator(win.treeView)
-    while iterator.value():
-        item = iterator.value()
-        name = item.text(0)
-        strUID = item.text(1)
-        uid = int(strUID)
-        pname = None
-        parent = item.parent()
-        if parent:
-            puid = parent.text(1)
-            pname = parent.text(0)
+    stack = [(0, None)]
+    while stack:  # (uid, parent name)
+        uid, pname = stack.pop()
+        name = win.treeName(uid)
         print(f"UID: {uid}; Name: {name}; Parent: {pname}")
-        iterator += 1
+        stack.extend((child, name) for child in reversed(win.treeChildren(uid)))
 
 def printDrawList():
     print("Draw List:", win.drawList)
@@ -958,11 +951,18 @@ def setUnits_mm():
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
-    win = MainWindow()
+    win = MainWindow(virtualTree='--virtual-tree' in sys.argv)
     win.add_menu('File')
     win.add_function_to_menu('File', "Load STEP", win.loadStep)
+    win.add_function_to_menu('File', "Load STEP (batch)", win.loadStepBatch)
+    win.add_function_to_menu('File', "Load STEP (incremental)", win.loadStepIncremental)
+    win.add_function_to_menu('File', "Load STEP (lazy)", win.loadStepLazy)
     win.add_function_to_menu('File', "Save STEP", win.saveStep)
+    win.add_function_to_menu('File', "Save STEP (resend changed parts only)", win.saveStepIncremental)
     win.add_function_to_menu('File', "Save STEP (Act Prt)", win.saveStepActPrt)
+    win.add_function_to_menu('File', "Cancel STEP Export", win.cancelExports)
+    win.add_function_to_menu('File', "Save Session", win.saveSession)
+    win.add_function_to_menu('File', "Open Session", win.openSession)
     win.add_menu('Workplane')
     win.add_function_to_menu('Workplane', "Workplane on face", wpOnFace)
     win.add_function_to_menu('Workplane', "Workplane by 3 points", wpBy3Pts)
@@ -1003,6 +1003,16 @@ if __name__ == '__main__':
     win.add_function_to_menu('Utility', "print(Active Prt Info)", printActivePartInfo)
     win.add_function_to_menu('Utility', "Clear Line Edit Stack", win.clearLEStack)
     win.add_function_to_menu('Utility', "Calculator", win.launchCalc)
+    win.add_function_to_menu('Utility', "Clear STEP Cache", win.clearStepCache)
+    win.add_function_to_menu('Utility', "print(Import Report)", win.printImportReport)
+    win.add_function_to_menu('Utility', "Save Import Report (JSON)", win.saveImportReport)
+    win.add_function_to_menu('Utility', "Toggle Import Trace", win.toggleImportTrace)
+    win.add_function_to_menu('Utility', "Toggle Batched Redraw", win.toggleBatchedRedraw)
+    win.add_function_to_menu('Utility', "Toggle LOD Navigation", win.toggleLod)
+    win.add_function_to_menu('Utility', "Toggle Instanced Display", win.toggleInstancedDisplay)
+    win.add_function_to_menu('Utility', "Toggle Frame Profiler", win.toggleProfiler)
+    win.add_function_to_menu('Utility', "print(History Stats)", win.printHistoryStats)
+    win.add_function_to_menu('Utility', "Set History Budget", win.setHistoryBudget)
     win.add_function_to_menu('Utility', "set Units ->in", setUnits_in)
     win.add_function_to_menu('Utility', "set Units ->mm", setUnits_mm)
 
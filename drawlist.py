@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+
+"""The drawList: uids of the parts & workplanes to be displayed."""
+
+from contextlib import contextmanager
+
+
+class DrawList():
+    """Insertion ordered set of uids, notifying listeners of changes.
+
+    Membership tests, add and remove take constant time. Each change is
+    reported to the listeners (see subscribe) as two lists of uids: those
+    added and those removed. Changes made within batch() are reported
+    once, at its end."""
+
+    def __init__(self, uids=()):
+        self._uids = dict.fromkeys(uids)  # k = uid, v = None (ordered set)
+        self._listeners = []
+        self._batch = None  # k = uid, v = True if added, False if removed
+
+    def __contains__(self, uid):
+        return uid in self._uids
+
+    def __iter__(self):
+        return iter(list(self._uids))
+
+    def __len__(self):
+        return len(self._uids)
+
+    def __repr__(self):
+        return "DrawList(%r)" % list(self._uids)
+
+    def subscribe(self, listener):
+        """Call listener(added, removed) whenever the drawList changes."""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self._listeners.remove(listener)
+
+    @contextmanager
+    def batch(self):
+        """Context manager reporting the changes made within all at once."""
+        if self._batch is not None:  # nested: the outer batch reports
+            yield
+            return
+        self._batch = changes = {}
+        try:
+            yield
+        finally:
+            self._batch = None
+            added = [uid for uid, isAdded in changes.items() if isAdded]
+            removed = [uid for uid, isAdded in changes.items() if not isAdded]
+            self._notify(added, removed)
+
+    def _changed(self, uid, added):
+        if self._batch is None:
+            if added:
+                self._notify([uid], [])
+            else:
+                self._notify([], [uid])
+        elif self._batch.get(uid, added) != added:  # back as it was
+            del self._batch[uid]
+        else:
+            self._batch[uid] = added
+
+    def _notify(self, added, removed):
+        if added or removed:
+            for listener in list(self._listeners):
+                listener(added, removed)
+
+    def add(self, uid):
+        if uid not in self._uids:
+            self._uids[uid] = None
+            self._changed(uid, True)
+
+    def discard(self, uid):
+        if uid in self._uids:
+            del self._uids[uid]
+            self._changed(uid, False)
+
+    def remove(self, uid):
+        """Remove uid, which must be present (KeyError if not)."""
+        del self._uids[uid]
+        self._changed(uid, False)
+
+    def update(self, uids):
+        """Add uids (in order), reporting the change once."""
+        with self.batch():
+            for uid in uids:
+                self.add(uid)
+
+    def difference_update(self, uids):
+        """Remove uids (those present), reporting the change once."""
+        with self.batch():
+            for uid in uids:
+                self.discard(uid)
+
+    def clear(self):
+        self.difference_update(list(self._uids))
+
+    def replace(self, uids):
+        """Make the drawList hold exactly uids.
+
+        Those already present keep their place, the others are appended."""
+        uids = list(uids)
+        with self.batch():
+            keep = set(uids)
+            self.difference_update([uid for uid in self._uids if uid not in keep])
+            self.update(uids)
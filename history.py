@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+
+"""Modification history: ancestors of parts, spilled to disk when old.
+
+Modifying a part (see MainWindow.getNewPartUID) makes a new part and
+keeps the original as its ancestor, so that the user can step back to
+it. ModificationHistory keeps the recent generations of each part in
+memory: its ancestor, the ancestor of that... up to keep generations
+back. Older ancestors, as well as the least recently recorded ones
+whenever those in memory exceed the budget, are written to a
+HistoryStore (a compressed temporary file) and replaced by SpilledShape
+objects, which read them back when they are next needed (drawn, made
+active...). Once hidden again, they are released like any deferred part.
+
+The memory held by an ancestor is estimated from its topology and
+triangulation (see estimateSize), so that recording one costs no more
+than walking its faces and edges. Shapes are only serialized when spilled.
+"""
+
+import logging
+import tempfile
+import zlib
+from collections import OrderedDict
+from OCC.Core.BRep import BRep_Tool
+from OCC.Core.TopAbs import TopAbs_EDGE, TopAbs_FACE
+from OCC.Core.TopExp import TopExp_Explorer
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.TopoDS import topods_Face
+from partdict import DeferredShape
+import shapeio
+
+logger = logging.getLogger(__name__)
+
+GENERATIONS = 3  # generations of ancestors of a part kept in memory
+BUDGET = 256 * 2**20  # bytes (estimated) of ancestors kept in memory
+# Rough memory use of the parts of a shape (see estimateSize)
+FACE_BYTES = 600  # surface, wires
+EDGE_BYTES = 300  # curve, pcurves, vertices (shared edges are counted twice)
+NODE_BYTES = 40  # triangulation node (3D point, UV point)
+TRIANGLE_BYTES = 12
+
+
+def estimateSize(shape):
+    """Return rough estimate of the memory (bytes) held by shape."""
+    size = 0
+    explorer = TopExp_Explorer(shape, TopAbs_FACE)
+    while explorer.More():
+        size += FACE_BYTES
+        loc = TopLoc_Location()
+        triangulation = BRep_Tool.Triangulation(topods_Face(explorer.Current()), loc)
+        if triangulation is not None and not triangulation.IsNull():
+            size += (triangulation.NbNodes() * NODE_BYTES
+                     + triangulation.NbTriangles() * TRIANGLE_BYTES)
+        explorer.Next()
+    explorer = TopExp_Explorer(shape, TopAbs_EDGE)
+    while explorer.More():
+        size += EDGE_BYTES
+        explorer.Next()
+    return size
+
+
+class HistoryStore():
+    """Shapes stored as compressed BRep, appended to a temporary file."""
+
+    def __init__(self):
+        self._file = None  # created when the first shape is written
+        self._toc = {}  # k = uid, v = (offset, length)
+
+    def __contains__(self, uid):
+        return uid in self._toc
+
+    def write(self, uid, shape):
+        """Store shape under uid. Return sizes (BRep, compressed)."""
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix='cadviewer-history-')
+        data = shapeio.shapeToBytes(shape)
+        blob = zlib.compress(data)
+        f = self._file
+        f.seek(0, 2)
+        self._toc[uid] = (f.tell(), len(blob))
+        f.write(blob)
+        return len(data), len(blob)
+
+    def read(self, uid):
+        """Return (a new copy of) the shape stored under uid."""
+        offset, length = self._toc[uid]
+        self._file.seek(offset)
+        return shapeio.shapeFromBytes(zlib.decompress(self._file.read(length)))
+
+    def close(self):
+        """Close (and so delete) the file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._toc = {}
+
+
+class SpilledShape(DeferredShape):
+    """Ancestor shape spilled to the HistoryStore, read back when needed.
+
+    The shape is stored without its location, which is kept here."""
+
+    def __init__(self, history, uid, loc=None):
+        DeferredShape.__init__(self)
+        self.history = history
+        self.uid = uid
+        self.loc = loc  # TopLoc_Location
+
+    def load(self):
+        shape = self.history.reload(self.uid)
+        if self.loc is not None:
+            shape = shape.Located(self.loc)
+        return shape
+
+    def location(self):
+        """Return the location of the part, without loading it."""
+        if self.isLoaded():
+            return self._shape.Location()
+        return self.loc
+
+    def release(self):
+        if self.isLoaded():
+            # The part may have been moved in place (shape.Move)
+            self.loc = self._shape.Location()
+        DeferredShape.release(self)
+
+
+class ModificationHistory():
+    """Ancestors of parts, with the older ones spilled to a HistoryStore.
+
+    parts and ancestors are dicts (see PartRegistry): k = uid, v = shape
+    and k = uid, v = ancestorUID. Spilled parts are replaced in parts by
+    a SpilledShape. Parts for which isPinned(uid) is True (such as drawn
+    or active parts) are left in memory. Each listener is called with
+    the uid of each part spilled."""
+
+    def __init__(self, parts, ancestors, keep=GENERATIONS, budget=BUDGET):
+        self.parts = parts
+        self.ancestors = ancestors
+        self.keep = keep
+        self.budget = budget
+        self.isPinned = lambda uid: False
+        self.listeners = []
+        self.store = HistoryStore()
+        self.clear()
+
+    def clear(self):
+        self.store.close()
+        self._resident = OrderedDict()  # k = ancestor uid, v = estimated size (oldest first)
+        self._residentBytes = 0
+        self.counters = {'spilled (generations)': 0,
+                         'spilled (budget)': 0,
+                         'BRep bytes spilled': 0,
+                         'bytes on disk': 0,
+                         'reloads': 0}
+
+    def record(self, uid, ancestor):
+        """Note that part (uid) was made by modifying part (ancestor).
+
+        Then spill the ancestors more than keep generations older than uid,
+        and (oldest first) those which don't fit within the budget."""
+        if (ancestor in self.parts and self.parts.deferred(ancestor) is None
+                and ancestor not in self._resident):
+            size = estimateSize(self.parts[ancestor])
+            self._resident[ancestor] = size
+            self._residentBytes += size
+        generation = 1
+        while ancestor:
+            if generation > self.keep:
+                if ancestor not in self._resident:
+                    break  # older ones were dealt with when this one was
+                self.spill(ancestor, 'generations')
+            ancestor = self.ancestors.get(ancestor, 0)
+            generation += 1
+        self.fitBudget()
+
+    def fitBudget(self):
+        """Spill the oldest ancestors until those in memory fit the budget."""
+        for uid in list(self._resident):
+            if self._residentBytes <= self.budget:
+                break
+            self.spill(uid, 'budget')
+
+    def spill(self, uid, reason):
+        """Write part (uid) to the store, unless pinned. Return True if spilled."""
+        if self.isPinned(uid):
+            return False
+        self._residentBytes -= self._resident.pop(uid)
+        shape = self.parts[uid]
+        size, packed = self.store.write(uid, shape.Located(TopLoc_Location()))
+        self.parts[uid] = SpilledShape(self, uid, shape.Location())
+        self.counters['spilled (%s)' % reason] += 1
+        self.counters['BRep bytes spilled'] += size
+        self.counters['bytes on disk'] += packed
+        logger.debug("Ancestor %i spilled (%s): %i bytes", uid, reason, packed)
+        for listener in self.listeners:
+            listener(uid)
+        return True
+
+    def reload(self, uid):
+        """Return the shape of spilled part (uid), read from the store."""
+        self.counters['reloads'] += 1
+        return self.store.read(uid)
+
+    def stats(self):
+        """Return dict of the history's memory use & eviction counters."""
+        return dict(self.counters,
+                    **{'ancestors in memory': len(self._resident),
+                       'bytes in memory (estimated)': self._residentBytes,
+                       'budget': self.budget,
+                       'generations kept': self.keep})
+
+    def report(self):
+        """Return the stats as text, one per line."""
+        return "\n".join("%s: %s" % item for item in self.stats().items())
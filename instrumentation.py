@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+import bisect
+import csv
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class ImportStats():
+    """Phase timers, counters and an (opt-in) trace of one STEP import.
+
+    Timers and counters are cheap enough to be always on. The trace is
+    only recorded if tracing is True; code which traces in a tight loop
+    should test stats.tracing first, so that it costs nothing otherwise.
+    """
+
+    def __init__(self, name, tracing=False):
+        self.name = name
+        self.tracing = tracing
+        self.phases = {}    # k = phase name, v = seconds (in order started)
+        self.counters = {}  # k = counter name, v = int
+        self.traceLog = []
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager adding the time spent within to phase (name)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addTime(name, time.perf_counter() - start)
+
+    def addTime(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.) + seconds
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def setCount(self, name, n):
+        self.counters[name] = n
+
+    def trace(self, msg, *args):
+        if self.tracing:
+            self.traceLog.append(msg % args)
+
+    def totalTime(self):
+        return sum(self.phases.values())
+
+    def report(self):
+        """Return a multi-line, human readable report."""
+        lines = ["Import report: %s" % self.name]
+        for name, secs in self.phases.items():
+            lines.append("  %-16s %9.3f s" % (name, secs))
+        lines.append("  %-16s %9.3f s" % ('total', self.totalTime()))
+        for name, n in self.counters.items():
+            lines.append("  %-16s %9i" % (name, n))
+        if self.traceLog:
+            lines.append("  trace: %i entries" % len(self.traceLog))
+        return '\n'.join(lines)
+
+    def asDict(self):
+        return {'name': self.name,
+                'phases': self.phases,
+                'counters': self.counters,
+                'trace': self.traceLog}
+
+    @classmethod
+    def fromDict(cls, d):
+        stats = cls(d['name'], tracing=bool(d['trace']))
+        stats.phases = dict(d['phases'])
+        stats.counters = dict(d['counters'])
+        stats.traceLog = list(d['trace'])
+        return stats
+
+    def toJson(self, **kwargs):
+        return json.dumps(self.asDict(), **kwargs)
+
+
+class FrameProfiler():
+    """Frame times of viewer interactions, split into phases.
+
+    A frame is one interaction: a redraw, a rotation step, a hover
+    highlight (MoveTo), a selection, a repaint... Frames started while
+    another is running are counted as phases of it. The last `window`
+    frame times are kept for a rolling histogram. Each frame can also be
+    written as a row of a CSV file, to compare builds.
+
+    While not enabled, frame() and phase() cost next to nothing.
+    """
+
+    # Viewer3d methods timed as frames (see attach)
+    INTERACTIONS = ('Rotation', 'Pan', 'DynamicZoom', 'ZoomFactor', 'ZoomArea',
+                    'MoveTo', 'Select', 'ShiftSelect', 'SelectArea',
+                    'Repaint', 'FitAll')
+    BINS_MS = (2, 4, 8, 16, 33, 66, 133)  # histogram bin upper bounds
+    BARS = ' .:-=+*#'
+    CSV_FIELDS = ('time', 'kind', 'ms', 'triangles', 'objects', 'phases')
+
+    def __init__(self, window=240):
+        self.enabled = False
+        self.frames = deque(maxlen=window)  # (kind, seconds, phases)
+        self.counts = lambda: (0, 0)  # returns (triangles, objects) displayed
+        self.listeners = []  # called with (kind, seconds, phases) of each frame
+        self._current = None  # phases of the frame running, if any
+        self._csvFile = None
+        self._csv = None
+        self._wrapped = {}  # k = method name, v = original (see attach)
+
+    @contextmanager
+    def frame(self, kind):
+        """Context manager timing a frame (kind) or, within one, a phase."""
+        if not self.enabled or self._current is not None:
+            with self.phase(kind):
+                yield
+            return
+        self._current = phases = {}  # k = phase name, v = seconds
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._current = None
+            self.addFrame(kind, time.perf_counter() - start, phases)
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager adding the time spent within to phase (name)."""
+        phases = self._current
+        if phases is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phases[name] = phases.get(name, 0.) + time.perf_counter() - start
+
+    def addFrame(self, kind, seconds, phases):
+        self.frames.append((kind, seconds, phases))
+        if self._csv is not None:
+            triangles, objects = self.counts()
+            self._csv.writerow([
+                '%.3f' % time.time(), kind, '%.3f' % (1e3 * seconds),
+                triangles, objects,
+                ';'.join('%s=%.3f' % (name, 1e3 * secs)
+                         for name, secs in phases.items())])
+        for listener in self.listeners:
+            listener(kind, seconds, phases)
+
+    def attach(self, display):
+        """Time the interactions (INTERACTIONS) of display (Viewer3d)."""
+        for name in self.INTERACTIONS:
+            if name not in self._wrapped and hasattr(display, name):
+                method = getattr(display, name)
+                self._wrapped[name] = method
+                setattr(display, name, self._timed(name, method))
+
+    def detach(self, display):
+        for name in self._wrapped:
+            delattr(display, name)  # the class method shows through again
+        self._wrapped = {}
+
+    def _timed(self, kind, method):
+        def timed(*args, **kwargs):
+            with self.frame(kind):
+                return method(*args, **kwargs)
+        return timed
+
+    def openCsv(self, fname):
+        """Write each frame from now on to CSV file fname."""
+        self.closeCsv()
+        self._csvFile = open(fname, 'w', newline='')
+        self._csv = csv.writer(self._csvFile)
+        self._csv.writerow(self.CSV_FIELDS)
+
+    def closeCsv(self):
+        if self._csvFile is not None:
+            self._csvFile.close()
+        self._csvFile = None
+        self._csv = None
+
+    def histogram(self):
+        """Return counts of recent frames in each bin (see BINS_MS).
+
+        The last bin counts the frames longer than BINS_MS[-1]."""
+        counts = [0] * (len(self.BINS_MS) + 1)
+        for kind, seconds, phases in self.frames:
+            counts[bisect.bisect_left(self.BINS_MS, 1e3 * seconds)] += 1
+        return counts
+
+    def histogramText(self):
+        """Return histogram of recent frames as one bar character per bin."""
+        counts = self.histogram()
+        most = max(counts) or 1
+        top = len(self.BARS) - 1
+        return ''.join(self.BARS[(top * n + most - 1) // most] for n in counts)
+
+    def summary(self, kind, seconds, phases):
+        """Return a one-line summary of a frame, for a status bar."""
+        triangles, objects = self.counts()
+        text = "%s %.1f ms" % (kind, 1e3 * seconds)
+        if phases:
+            text += " [%s]" % ', '.join('%s %.1f' % (name, 1e3 * secs)
+                                        for name, secs in phases.items())
+        return ("%s | %i tris, %i objs | frames [%s] %i..%i+ ms"
+                % (text, triangles, objects, self.histogramText(),
+                   self.BINS_MS[0], self.BINS_MS[-1]))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+
+"""Coarse levels of detail of displayed parts, shown while navigating.
+
+While the view is rotated, panned or zoomed, each displayed part is
+shown at the coarsest of its levels whose chordal deviation, projected
+on screen, stays within NAV_PIXELS. So parts small on screen are shown
+coarsest. Once the view is left alone (see MainWindow.endNavigation),
+the parts are shown at full quality again.
+
+Level 0 is the part's own presentation, meshed to the display deflection
+(see meshing.py). In OCCT 7.4, a face holds a single triangulation, so
+each coarse level is a presentation of a copy of the part (sharing its
+geometry, not its topology), meshed to LOD_FACTORS times the display
+deflection. Coarse levels are built lazily, a few parts at a time, when
+the GUI is idle (see buildSome). Until they are, a part is shown at full
+quality during navigation. The levels of a part are dropped when it is
+hidden.
+
+Building levels (copying and meshing parts) runs on the GUI thread, as
+OCC holds the GIL, so LOD navigation is off by default (it is turned on
+with the 'Toggle LOD Navigation' menu item).
+"""
+
+import logging
+from OCC.Core.AIS import AIS_Shape
+from OCC.Core.BRepBuilderAPI import BRepBuilderAPI_Copy
+from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
+from OCC.Core.TCollection import TCollection_HAsciiString
+import meshing
+import shapeio
+
+logger = logging.getLogger(__name__)
+
+LOD_FACTORS = (8., 32.)  # deflection of coarse levels / display deflection
+MAX_ANGLE = 0.5  # largest angular deflection (radians) of coarse levels
+NAV_PIXELS = 1.5  # chordal deviation (pixels) allowed while navigating
+IDLE_MS = 300  # navigation ends when the view is left alone this long
+BATCH_SIZE = 20  # parts whose coarse levels are built per idle step
+
+
+def pixelsPerUnit(view):
+    """Return the scale of view (V3d_View), in pixels per model unit.
+
+    The smaller of the horizontal and vertical scales, should they differ."""
+    width, height = view.Size()
+    widthPx, heightPx = view.Window().Size()
+    if width <= 0 or height <= 0:
+        return 0.
+    return min(widthPx / width, heightPx / height)
+
+class LodManager():
+    """Coarse presentations of parts, keyed by uid (as MainWindow._aisDict)."""
+
+    def __init__(self):
+        self._levels = {}  # k = uid, v = [(deflection, AIS_Shape)] finest first
+        self._pending = {}  # k = uid, v = (shape, rgb, transp) to build levels of
+        self._shown = {}  # k = uid, v = (AIS_Shape, coarse AIS_Shape shown instead)
+        self.navigating = False
+
+    def request(self, uid, shape, rgb, transp):
+        """Have coarse levels of part (uid) built (see buildSome)."""
+        if uid not in self._levels:
+            self._pending[uid] = (shape, rgb, transp)
+
+    def hasPending(self):
+        return bool(self._pending)
+
+    def forget(self, uid, context):
+        """Remove coarse levels of part (uid), no longer like its presentation."""
+        self._pending.pop(uid, None)
+        for deflection, aisShape in self._levels.pop(uid, []):
+            context.Remove(aisShape, False)
+
+    def forgetAll(self, context):
+        """Remove all coarse levels from context and forget them."""
+        for uid in list(self._levels):
+            self.forget(uid, context)
+        self.clear()
+
+    def clear(self):
+        """Forget all levels (after they were removed from the context)."""
+        self._levels = {}
+        self._pending = {}
+        self._shown = {}
+        self.navigating = False
+
+    def buildSome(self, context, n=BATCH_SIZE):
+        """Build coarse levels of n pending parts. Return True if any remain."""
+        drawer = context.DefaultDrawer()
+        for i in range(min(n, len(self._pending))):
+            uid, (shape, rgb, transp) = self._pending.popitem()
+            self._levels[uid] = self.buildLevels(uid, shape, rgb, transp,
+                                                 context, drawer)
+        return bool(self._pending)
+
+    def buildLevels(self, uid, shape, rgb, transp, context, drawer):
+        """Return [(deflection, AIS_Shape)] of coarse levels of shape.
+
+        Their presentations are computed now (displayed, then erased), so
+        showing them during navigation costs little."""
+        levels = []
+        deflection, angle = meshing.displayDeflection(shape, drawer)
+        if deflection <= 0.:
+            return levels
+        color = shapeio.colorFromTuple(rgb)
+        for factor in LOD_FACTORS:
+            copy = BRepBuilderAPI_Copy(shape, False).Shape()  # shares geometry
+            BRepMesh_IncrementalMesh(copy, deflection * factor, False,
+                                     min(angle * factor, MAX_ANGLE), True)
+            aisShape = AIS_Shape(copy)
+            aisShape.SetOwner(TCollection_HAsciiString(str(uid)))
+            aisShape.Attributes().SetAutoTriangulation(False)  # keep coarse mesh
+            context.Display(aisShape, context.DisplayMode(), -1, False)
+            context.SetColor(aisShape, color, False)
+            context.SetTransparency(aisShape, transp, False)
+            context.Erase(aisShape, False)
+            levels.append((deflection * factor, aisShape))
+        return levels
+
+    def chooseLevel(self, uid, pxPerUnit):
+        """Return coarsest level of part (uid) fine enough on screen, or None."""
+        chosen = None
+        for deflection, aisShape in self._levels.get(uid, []):
+            if deflection * pxPerUnit <= NAV_PIXELS:
+                chosen = aisShape
+        return chosen
+
+    def beginNavigation(self, display, presentations):
+        """Show parts at coarse levels, instead of their presentations.
+
+        presentations: {uid: AIS_Shape}. The viewer is not updated: the
+        navigation (rotation etc.) which follows will update it."""
+        context = display.Context
+        pxPerUnit = pixelsPerUnit(display.View)
+        for uid, aisShape in presentations.items():
+            if not context.IsDisplayed(aisShape):
+                continue
+            coarse = self.chooseLevel(uid, pxPerUnit)
+            if coarse is not None:
+                context.Erase(aisShape, False)
+                context.Display(coarse, context.DisplayMode(), -1, False)
+                self._shown[uid] = (aisShape, coarse)
+        self.navigating = True
+        logger.debug("Navigating with %i of %i parts coarse",
+                     len(self._shown), len(presentations))
+
+    def endNavigation(self, display):
+        """Show the parts shown at coarse levels at full quality again."""
+        if not self.navigating:
+            return
+        context = display.Context
+        for aisShape, coarse in self._shown.values():
+            context.Erase(coarse, False)
+            context.Display(aisShape, False)
+        self._shown = {}
+        self.navigating = False
+        context.UpdateCurrentViewer()
@@ -21,33 +21,32 @@
 # 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 #
 
+import json
 import logging
 import os, os.path
 import sys
-from PyQt5.QtCore import Qt, QPersistentModelIndex, QModelIndex
+import time
+from PyQt5.QtCore import Qt, QPersistentModelIndex, QModelIndex, QTimer, pyqtSignal
 from PyQt5.QtGui import QBrush, QColor
-from PyQt5.QtWidgets import (QLabel, QMainWindow, QTreeWidget, QMenu,
+from PyQt5.QtWidgets import (QApplication, QLabel, QMainWindow, QTreeWidget, QMenu,
                              QDockWidget, QDesktopWidget, QToolButton,
                              QLineEdit, QTreeWidgetItem, QAction, QDockWidget,
                              QToolBar, QFileDialog, QAbstractItemView,
-                             QInputDialog, QTreeWidgetItemIterator)
-from OCC.Core.AIS import AIS_Shape, AIS_Line, AIS_Circle
+                             QInputDialog, QProgressDialog)
+from OCC.Core.AIS import (AIS_Shape, AIS_Line, AIS_Circle, AIS_KOI_None,
+                          AIS_ConnectedInteractive,
+                          AIS_ListOfInteractive,
+                          AIS_ListIteratorOfListOfInteractive)
 from OCC.Core.BRep import BRep_Tool
 from OCC.Core.BRepAdaptor import BRepAdaptor_Curve
 from OCC.Core.CPnts import CPnts_AbscissaPoint_Length
 from OCC.Core.gp import gp_Vec
-from OCC.Core.IFSelect import IFSelect_RetDone
-from OCC.Core.Interface import Interface_Static_SetCVal
 from OCC.Core.Prs3d import Prs3d_LineAspect
 from OCC.Core.Quantity import (Quantity_Color, Quantity_NOC_GRAY,
                                Quantity_NOC_DARKGREEN, Quantity_NOC_MAGENTA1)
-from OCC.Core.STEPCAFControl import STEPCAFControl_Writer
-from OCC.Core.STEPControl import STEPControl_Writer, STEPControl_AsIs
-from OCC.Core.TCollection import TCollection_ExtendedString
-from OCC.Core.TDataStd import TDataStd_Name
-from OCC.Core.TDF import TDF_LabelSequence
+from OCC.Core.TCollection import TCollection_HAsciiString
+from OCC.Core.TopLoc import TopLoc_Location
 from OCC.Core.TopoDS import (topods_Edge, topods_Vertex)
-from OCC.Core.XCAFDoc import XCAFDoc_DocumentTool_ShapeTool
 import OCC.Display.OCCViewer
 import OCC.Display.backend
 used_backend = OCC.Display.backend.load_backend()
@@ -55,14 +54,26 @@ used_backend = OCC.Display.backend.load_backend()
 # import local version instead (allows changing rotate/pan/zoom controls)
 import myDisplay.qtDisplay as qtDisplay
 from OCC import VERSION
+from assyTreeModel import ROOT, AssyTreeModel, AssyTreeView
+from instrumentation import FrameProfiler, ImportStats
+from drawlist import DrawList
+from registry import NO_UID, PartRegistry
+import history
+import lod
+import meshing
 import rpnCalculator
+import session
+import shapeio
+import stepCache
+import stepExport
 import stepXD
+import treelib
 
 print("OCC version: %s" % VERSION)
 
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG) # set to DEBUG | INFO | ERROR
+logger.setLevel(logging.INFO) # set to DEBUG | INFO | ERROR
 
 
 class TreeView(QTreeWidget): # With 'drag & drop' ; context menu
@@ -80,6 +91,7 @@ class TreeView(QTreeWidget): # With 'drag & drop' ; context menu
     IDEA: As an alternative to 'drag & drop', consider adding an option to
     the RMB pop-up to change the parent of a QTreeWidgetItem.
     """
+    itemsMoved = pyqtSignal(list, int)  # uids moved, uid of new parent
 
     def __init__(self, parent=None):
         QTreeWidget.__init__(self, parent)
@@ -124,6 +136,7 @@ class TreeView(QTreeWidget): # With 'drag & drop' ; context menu
                 taken.append(self.takeTopLevelItem(index.row()))
             else:
                 taken.append(item.parent().takeChild(index.row()))
+        uids = [int(item.text(1)) for item in taken]
         # insert the selected items at their new positions
         while taken:
             if position == -1:
@@ -141,11 +154,15 @@ class TreeView(QTreeWidget): # With 'drag & drop' ; context menu
                 else:
                     self.insertTopLevelItem(min(target, self.topLevelItemCount()),
                                             taken.pop(0))
+        self.itemsMoved.emit(uids, int(parent.text(1))
+                             if parent_index.isValid() else NO_UID)
         return True
 
 class MainWindow(QMainWindow):
-    def __init__(self, *args):
+    def __init__(self, *args, virtualTree=False):
         super().__init__()
+        # Show Assy/Part structure with AssyTreeView (else with TreeView)
+        self.virtualTree = virtualTree
         self.canva = qtDisplay.qtViewer3d(self)
         # Renaming self.canva._display (like below) doesn't work.
         # self.display = self.canva._display
@@ -171,10 +188,11 @@ class MainWindow(QMainWindow):
 
         self.calculator = None
 
-        itemName = ['/', str(0)] # Root Item in TreeView
-        self.treeViewRoot = QTreeWidgetItem(self.treeView, itemName)
-        self.treeView.expandItem(self.treeViewRoot)
+        self._itemDict = {}  # k = uid, v = QTreeWidgetItem (TreeView only)
+        self.addTreeRoot()
+        self._activeItems = {}  # k = 'p', 'a' or 'w', v = uid shown active
         self.itemClicked = None   # TreeView item that has been mouse clicked
+        self.uidClicked = None    # uid of the treeView item mouse clicked
 
         # Internally, everything is always in mm
         # scale user input and output values
@@ -206,7 +224,7 @@ class MainWindow(QMainWindow):
         status.showMessage("Ready", 5000)
 
         self._currentUID = 0
-        self.drawList = []      # list of part uid's to be displayed
+        self.drawList = DrawList()  # uid's of parts & wps to be displayed
         self.floatStack = []    # storage stack for floating point values
         self.xyPtStack = []     # storage stack for 2d points (x, y)
         self.ptStack = []       # storage stack for gp_Pnts
@@ -217,30 +235,96 @@ class MainWindow(QMainWindow):
 
         self.activePart = None  # <TopoDS_Shape> object
         self.activePartUID = 0
-        self._partDict = {}     # k = uid, v = <ToopoDS_Shape> object
-        self._nameDict = {}     # k = uid, v = partName
-        self._colorDict = {}    # k = uid, v = part display color
-        self._transparencyDict = {}    # k = uid, v = part display transparency
-        self._ancestorDict = {} # k = uid, v = ancestorUID
+        # Parts, assys & wps (by uid), viewed as dicts of their attributes
+        self.registry = PartRegistry()
+        self._partDict = self.registry.parts  # k = uid, v = <ToopoDS_Shape> object
+        self._nameDict = self.registry.names  # k = uid, v = partName
+        self._colorDict = self.registry.colors  # k = uid, v = part display color
+        # k = uid, v = part display transparency
+        self._transparencyDict = self.registry.transparency
+        self._ancestorDict = self.registry.ancestors  # k = uid, v = ancestorUID
+        # k = uid, v = prototypeUID (shares TShape)
+        self._prototypeDict = self.registry.prototypes
+        self._instanceDict = {}   # k = prototypeUID, v = list of instance uids
+        # Ancestors of modified parts (older ones spilled to disk)
+        self.history = history.ModificationHistory(self._partDict,
+                                                   self._ancestorDict)
+        self.history.isPinned = self.isHistoryPinned
+        self.history.listeners.append(self.partSpilled)
 
         self.activeWp = None    # WorkPlane object
         self.activeWpUID = 0
-        self._wpDict = {}       # k = uid, v = wpObject
+        self._wpDict = self.registry.wps  # k = uid, v = wpObject
         self._wpNmbr = 1
 
         self.activeAsy = self.treeViewRoot   # tree node object
         self.activeAsyUID = 0
-        self._assyDict = {}  # k = uid, v = Loc
+        self._assyDict = self.registry.assys  # k = uid, v = Loc
         self._assyDict[0] = None  # Root assembly has no location vector
         self.showItemActive(0)
         self.doc = None  # <class 'OCC.Core.TDocStd.TDocStd_Document'>
+        self.stepCache = stepCache.StepCache()  # imported STEP files
+        self.stepBatchSize = 200  # nodes per update in loadStepIncremental
+        self.importReports = []  # ImportStats of each STEP import (latest last)
+        self.importTracing = False  # record per-component trace of imports
+        self.importBatch = None  # stepXD.ImportBatch running, if any
+        self.importTimer = QTimer(self)  # polls importBatch while it runs
+        self.importTimer.setInterval(100)
+        self.importTimer.timeout.connect(self.pollImportBatch)
+        self.exportJobs = []  # stepExport.ExportJob objects still running
+        self.exportTimer = QTimer(self)  # polls exportJobs while any are running
+        self.exportTimer.setInterval(200)
+        self.exportTimer.timeout.connect(self.pollExportJobs)
+        self.incrementalExport = stepExport.IncrementalExport()
+        self.sessionArchive = None  # session.SessionArchive parts are read from
+        # k = uid, v = [AIS object, shape, color, transp, instance ref key] displayed
+        self._aisDict = {}
+        # k = (prototypeUID, color, transp), v = [AIS_Shape, number of users]
+        self._instanceRefs = {}
+        self.instancedDisplay = True  # display instances from shared references
+        self._wpPresentations = []  # AIS objects of workplanes (rebuilt by redraw)
+        self.batchedRedraw = True  # redraw updates the viewer once, at its end
+        self.lod = lod.LodManager()  # coarse levels of parts, for navigation
+        self.lodEnabled = False  # (see toggleLod)
+        self.navTimer = QTimer(self)  # ends navigation when view is left alone
+        self.navTimer.setSingleShot(True)
+        self.navTimer.setInterval(lod.IDLE_MS)
+        self.navTimer.timeout.connect(self.endNavigation)
+        self.lodTimer = QTimer(self)  # builds coarse levels when GUI is idle
+        self.lodTimer.setInterval(0)
+        self.lodTimer.timeout.connect(self.buildLods)
+        self.canva.sig_view_changed.connect(self.viewChanged)
+        self.profiler = FrameProfiler()  # frame times of viewer interactions
+        self.profiler.counts = lambda: self._displayedCounts
+        self.profiler.listeners.append(self.showFrameProfile)
+        self.profileLabel = QLabel()  # in status bar while profiling
+        self._triangleDict = {}  # k = uid, v = number of triangles displayed
+        self._displayedCounts = (0, 0)  # (triangles, objects) displayed
+        self._pendingDraw = set()  # uids (un)drawn since the viewer was updated
+        self.drawTimer = QTimer(self)  # shows drawList changes when GUI is idle
+        self.drawTimer.setSingleShot(True)
+        self.drawTimer.setInterval(0)
+        self.drawTimer.timeout.connect(self.redrawChanged)
+        self.drawList.subscribe(self.drawListChanged)
 
     def createDockWidget(self):
         self.treeDockWidget = QDockWidget("Assy/Part Structure", self)
         self.treeDockWidget.setObjectName("treeDockWidget")
         self.treeDockWidget.setAllowedAreas(Qt.LeftDockWidgetArea| Qt.RightDockWidgetArea)
-        self.treeView = TreeView()   # Assy/Part structure (display)
-        self.treeView.itemClicked.connect(self.treeViewItemClicked)
+        if self.virtualTree:
+            self.assyModel = AssyTreeModel()  # Assy/Part structure (data)
+            self.treeView = AssyTreeView()   # Assy/Part structure (display)
+            self.treeView.setModel(self.assyModel)
+            self.treeView.clicked.connect(self.treeIndexClicked)
+            self.assyModel.checkStateChanged.connect(self.treeChecksChanged)
+            self.assyModel.nodesMoved.connect(self.treeNodesMoved)
+        else:
+            self.assyModel = None
+            self.treeView = TreeView()   # Assy/Part structure (display)
+            self.treeView.itemClicked.connect(self.treeViewItemClicked)
+            self.treeView.itemChanged.connect(self.treeViewItemChanged)
+            self.treeView.itemsMoved.connect(self.treeNodesMoved)
+        self._changedItems = []  # items changed since drawList was synced
         self.treeDockWidget.setWidget(self.treeView)
         self.addDockWidget(Qt.LeftDockWidgetArea, self.treeDockWidget)
 
@@ -273,6 +357,11 @@ class MainWindow(QMainWindow):
             self.calculator.close()
         except:
             pass
+        if self.importBatch is not None:
+            self.importBatch.cancel()
+        self.cancelExports()
+        self.profiler.closeCsv()
+        self.history.clear()  # deletes its file
         event.accept()
 
     #############################################
@@ -285,148 +374,237 @@ class MainWindow(QMainWindow):
         self.menu = QMenu()
         action = self.popMenu.exec_(self.mapToGlobal(point))
 
+    def addTreeRoot(self):
+        """Add the root assembly (uid 0) to the (empty) treeView."""
+        if self.assyModel is not None:
+            self.treeViewRoot = None
+            self.assyModel.addNode(0, ROOT, '/', assy=True)
+            self.treeView.expand(self.assyModel.indexOf(0))
+        else:
+            itemName = ['/', str(0)] # Root Item in TreeView
+            self.treeViewRoot = QTreeWidgetItem(self.treeView, itemName)
+            self.treeView.expandItem(self.treeViewRoot)
+            self._itemDict = {0: self.treeViewRoot}
+
+    def treeChildren(self, uid):
+        """Return list of uids of the children of (uid) in the treeView."""
+        if self.assyModel is not None:
+            return list(self.assyModel.children(uid))
+        item = self._itemDict[uid]
+        return [int(item.child(i).text(1)) for i in range(item.childCount())]
+
+    def treeName(self, uid):
+        """Return name of (uid) shown in the treeView."""
+        if self.assyModel is not None:
+            return self.assyModel.name(uid)
+        return self._itemDict[uid].text(0)
+
+    def setTreeName(self, uid, name):
+        if self.assyModel is not None:
+            self.assyModel.setName(uid, name)
+        else:
+            self._itemDict[uid].setText(0, name)
+
+    def setTreeBackground(self, uid, color):
+        """Set background color (QColor, or None to clear) of (uid)."""
+        if self.assyModel is not None:
+            self.assyModel.setBackground(uid, color)
+        else:
+            item = self._itemDict.get(uid)
+            if item is not None:
+                if color is None:
+                    color = QColor(255, 255, 255, 0)
+                item.setBackground(0, QBrush(color))
+
+    def isInTree(self, uid):
+        if self.assyModel is not None:
+            return uid in self.assyModel
+        return uid in self._itemDict
+
+    def treeIndexClicked(self, index):  # called whenever AssyTreeView is clicked
+        self.uidClicked = self.assyModel.uidOf(index)
+
+    def treeChecksChanged(self, uids, checked):
+        """Update drawList from parts & wps (uids) the user (un)checked."""
+        uids = [uid for uid in uids
+                if (uid in self._partDict) or (uid in self._wpDict)]
+        if checked:
+            self.drawList.update(uids)
+        else:
+            self.drawList.difference_update(uids)
+
+    def treeNodesMoved(self, uids, parentUid):
+        """Record the new parent of the nodes (uids) dragged in treeView."""
+        for uid in uids:
+            self.registry.setParent(uid, parentUid)
+
     def treeViewItemClicked(self, item):  # called whenever treeView item is clicked
         self.itemClicked = item # store item
-        if not self.inSync():   # click may have been on checkmark. Update drawList (if needed)
-            self.syncDrawListToChecked()
-            self.redraw()
+        self.uidClicked = int(item.text(1))
+        # click may have been on checkmark. Update drawList (if needed)
+        self.syncDrawListToChanged()
+
+    def treeViewItemChanged(self, item, column):
+        """Note item as changed (its check state may have been clicked)."""
+        self._changedItems.append(item)
+
+    def syncDrawListToChanged(self):
+        """Update drawList from the check state of the items changed since
+        last synced, which are only those affected by a click.
+
+        Return True if drawList changed."""
+        changed = False
+        items = self._changedItems
+        self._changedItems = []
+        with self.drawList.batch():
+            for item in items:
+                uid = int(item.text(1))
+                if (uid in self._partDict) or (uid in self._wpDict):
+                    checked = item.checkState(0) == Qt.Checked
+                    if checked and uid not in self.drawList:
+                        self.drawList.add(uid)
+                        changed = True
+                    elif not checked and uid in self.drawList:
+                        self.drawList.remove(uid)
+                        changed = True
+        return changed
 
     def checkedToList(self):
         """Returns list of uid's of checked (part) items in treeView"""
-        dl = []
-        for item in self.treeView.findItems("", Qt.MatchContains | Qt.MatchRecursive):
-            if item.checkState(0) == 2:
-                strUID = item.text(1)
-                uid = int(strUID)
-                if (uid in self._partDict.keys()) or (uid in self._wpDict.keys()):
-                    dl.append(uid)
-        return dl
+        if self.assyModel is not None:
+            return [uid for uid in list(self._partDict) + list(self._wpDict)
+                    if self.assyModel.isChecked(uid)]
+        return [uid for uid, item in self._itemDict.items()
+                if ((uid in self._partDict) or (uid in self._wpDict))
+                and item.checkState(0) == Qt.Checked]
 
     def inSync(self):
         """Return True if checked items are in sync with drawList."""
-        return self.checkedToList() == self.drawList
+        checked = self.checkedToList()
+        return (len(checked) == len(self.drawList)
+                and all(uid in self.drawList for uid in checked))
 
     def syncDrawListToChecked(self):
-        self.drawList = self.checkedToList()
-
-    def syncCheckedToDrawList(self):
-        for item in self.treeView.findItems("", Qt.MatchContains | Qt.MatchRecursive):
-            strUID = item.text(1)
-            uid = int(strUID)
-            if (uid in self._partDict) or (uid in self._wpDict):
-                if uid in self.drawList:
-                    item.setCheckState(0, Qt.Checked)
-                else:
-                    item.setCheckState(0, Qt.Unchecked)
+        self.drawList.replace(self.checkedToList())
+
+    def syncCheckedToDrawList(self, uids=None):
+        """Check the items of uids (by default, all parts and workplanes)
+        which are in drawList, uncheck the others."""
+        if uids is None:
+            uids = list(self._partDict) + list(self._wpDict)
+        drawn = self.drawList
+        if self.assyModel is not None:
+            self.assyModel.setChecked([uid for uid in uids if uid in drawn], True)
+            self.assyModel.setChecked([uid for uid in uids if uid not in drawn], False)
+            return
+        for uid in uids:
+            item = self._itemDict.get(uid)
+            if item is not None:
+                state = Qt.Checked if uid in drawn else Qt.Unchecked
+                if item.checkState(0) != state:
+                    item.setCheckState(0, state)
+        self._changedItems = []  # in sync
 
     def sortViewItems(self):
         """Return dicts of view items sorted by type: (prt, ay, wp)"""
-        # Traverse all treeView items
-        iterator = QTreeWidgetItemIterator(self.treeView)
         pdict = {}  # part-types    {uid: item}
         adict = {}  # asy-types     {uid: item}
         wdict = {}  # wp-types      {uid: item}
-        while iterator.value():
-            item = iterator.value()
-            name = item.text(0)
-            strUID = item.text(1)
-            uid = int(strUID)
+        for uid, item in self._itemDict.items():
             if uid in self._partDict:
                 pdict[uid] = item
             elif uid in self._assyDict:
                 adict[uid] = item
             elif uid in self._wpDict:
                 wdict[uid] = item
-            iterator += 1
         return (pdict, adict, wdict)
 
     def setClickedActive(self):
         """Set item clicked in treeView Active."""
-        item = self.itemClicked
-        if item:
-            self.setItemActive(item)
+        uid = self.uidClicked
+        if uid is not None:
+            self.setUIDActive(uid)
             self.treeView.clearSelection()
             self.itemClicked = None
+            self.uidClicked = None
 
     def setItemActive(self, item):
         """From tree view item, set (part, wp or assy) to be active."""
         if item:
-            name = item.text(0)
-            strUID = item.text(1)
-            uid = int(strUID)
-            print(f"Part selected: {name}, UID: {uid}")
-            pd, ad, wd = self.sortViewItems()
-            if uid in pd:
-                self.setActivePart(uid)
-                sbText = "%s [uid=%i] is now the active part" % (name, uid)
-                self.redraw()
-            elif uid in wd:
-                self.setActiveWp(uid)
-                sbText = "%s [uid=%i] is now the active workplane" % (name, uid)
-                self.redraw()
-            elif uid in ad:
-                self.setActiveAsy(uid)
-                sbText = "%s [uid=%i] is now the active workplane" % (name, uid)
-            self.statusBar().showMessage(sbText, 5000)
+            self.setUIDActive(int(item.text(1)))
+
+    def setUIDActive(self, uid):
+        """Set (part, wp or assy) of uid (in tree view) to be active."""
+        name = self.treeName(uid)
+        print(f"Part selected: {name}, UID: {uid}")
+        if uid in self._partDict:
+            self.setActivePart(uid)
+            sbText = "%s [uid=%i] is now the active part" % (name, uid)
+            self.redraw()
+        elif uid in self._wpDict:
+            self.setActiveWp(uid)
+            sbText = "%s [uid=%i] is now the active workplane" % (name, uid)
+            self.redraw()
+        elif uid in self._assyDict:
+            self.setActiveAsy(uid)
+            sbText = "%s [uid=%i] is now the active workplane" % (name, uid)
+        self.statusBar().showMessage(sbText, 5000)
 
     def showItemActive(self, uid):
         """Update tree view to show active status of (uid)."""
-        pd, ad, wd = self.sortViewItems()
-        if uid in pd:
-            # Clear BG color of all part items
-            for itm in pd.values():
-                itm.setBackground(0, QBrush(QColor(255, 255, 255, 0)))
-            # Set BG color of new active part
-            pd[uid].setBackground(0, QBrush(QColor('gold')))
-        elif uid in wd:
-            # Clear BG color of all wp items
-            for itm in wd.values():
-                itm.setBackground(0, QBrush(QColor(255, 255, 255, 0)))
-            # Set BG color of new active wp
-            wd[uid].setBackground(0, QBrush(QColor('lightgreen')))
-        elif uid in ad:
-            # Clear BG color of all asy items
-            for itm in ad.values():
-                itm.setBackground(0, QBrush(QColor(255, 255, 255, 0)))
-            # Set BG color of new active asy
-            ad[uid].setBackground(0, QBrush(QColor('lightblue')))
+        if uid in self._partDict:
+            typ, color = 'p', 'gold'
+        elif uid in self._wpDict:
+            typ, color = 'w', 'lightgreen'
+        elif uid in self._assyDict:
+            typ, color = 'a', 'lightblue'
+        else:
+            return
+        if not self.isInTree(uid):
+            return
+        # Clear BG color of the item of same type previously active
+        prevUID = self._activeItems.get(typ)
+        if prevUID is not None and prevUID != uid and self.isInTree(prevUID):
+            self.setTreeBackground(prevUID, None)
+        # Set BG color of new active item
+        self.setTreeBackground(uid, QColor(color))
+        self._activeItems[typ] = uid
 
     def setTransparent(self):
-        item = self.itemClicked
-        if item:
-            strUID = item.text(1)
-            uid = int(strUID)
+        """Make part clicked transparent."""
+        uid = self.uidClicked
+        if uid is not None:
             if uid in self._partDict:
                 self._transparencyDict[uid] = 0.6
                 self.redraw()
             self.itemClicked = None
+            self.uidClicked = None
 
     def setOpaque(self):
-        item = self.itemClicked
-        if item:
-            strUID = item.text(1)
-            uid = int(strUID)
+        """Make part clicked opaque."""
+        uid = self.uidClicked
+        if uid is not None:
             if uid in self._partDict:
-                self._transparencyDict.pop(uid)
+                self._transparencyDict.pop(uid, None)
                 self.redraw()
             self.itemClicked = None
+            self.uidClicked = None
 
     def editName(self): # Edit name of item clicked in treeView
-        item = self.itemClicked
+        uid = self.uidClicked
         sbText = '' # status bar text
-        if item:
-            name = item.text(0)
-            strUID = item.text(1)
-            uid = int(strUID)
+        if uid is not None:
+            name = self.treeName(uid)
             prompt = 'Enter new name for part %s' % name
             newName, OK = QInputDialog.getText(self, 'Input Dialog',
                                                prompt, text=name)
             if OK:
-                item.setText(0, newName)
+                self.setTreeName(uid, newName)
                 sbText = "Part name changed to %s" % newName
                 self._nameDict[uid] = newName
         self.treeView.clearSelection()
         self.itemClicked = None
+        self.uidClicked = None
         # Todo: update name in treeModel
         self.statusBar().showMessage(sbText, 5000)
 
@@ -436,6 +614,135 @@ class MainWindow(QMainWindow):
     #
     #############################################
 
+    def clearStepCache(self):
+        self.stepCache.clear()
+        self.statusBar().showMessage("STEP import cache cleared", 5000)
+
+    def addImportReport(self, stats):
+        self.importReports.append(stats)
+        logger.info(stats.report())
+
+    def printImportReport(self):
+        if not self.importReports:
+            print("No STEP files imported yet")
+            return
+        print(self.importReports[-1].report())
+
+    def saveImportReport(self):
+        """Save the reports of all STEP imports (this session) as JSON."""
+        if not self.importReports:
+            self.statusBar().showMessage("No STEP files imported yet", 5000)
+            return
+        prompt = 'Choose filename for import report.'
+        fnametuple = QFileDialog.getSaveFileName(None, prompt, './',
+                                                 "JSON files (*.json)")
+        fname, _ = fnametuple
+        if not fname:
+            print("Save import report cancelled.")
+            return
+        with open(fname, 'w') as f:
+            json.dump([stats.asDict() for stats in self.importReports], f, indent=2)
+        self.statusBar().showMessage("Import report saved to %s" % fname, 5000)
+
+    def toggleBatchedRedraw(self):
+        self.batchedRedraw = not self.batchedRedraw
+        sbText = "Batched redraw %s" % ('on' if self.batchedRedraw else 'off')
+        self.statusBar().showMessage(sbText, 5000)
+
+    def toggleLod(self):
+        self.lodEnabled = not self.lodEnabled
+        if not self.lodEnabled:
+            self.endNavigation()
+            self.lodTimer.stop()
+            self.lod.forgetAll(self.canva._display.Context)
+        else:
+            self.redraw()  # request levels of displayed parts
+        sbText = "LOD navigation %s" % ('on' if self.lodEnabled else 'off')
+        self.statusBar().showMessage(sbText, 5000)
+
+    def toggleInstancedDisplay(self):
+        self.instancedDisplay = not self.instancedDisplay
+        self.removeAllPresentations()  # so every part is displayed anew
+        self.redraw()
+        sbText = "Instanced display %s" % ('on' if self.instancedDisplay else 'off')
+        self.statusBar().showMessage(sbText, 5000)
+
+    def toggleProfiler(self):
+        """Show frame times in the status bar and log them as CSV (or stop).
+
+        The CSV file is written to ~/.cadviewer/frames-<date-time>.csv"""
+        profiler = self.profiler
+        display = self.canva._display
+        status = self.statusBar()
+        if profiler.enabled:
+            profiler.enabled = False
+            profiler.detach(display)
+            profiler.closeCsv()
+            status.removeWidget(self.profileLabel)
+            status.showMessage("Profiling off", 5000)
+            return
+        dirname = os.path.join(os.path.expanduser('~'), '.cadviewer')
+        os.makedirs(dirname, exist_ok=True)
+        fname = os.path.join(dirname, time.strftime('frames-%Y%m%d-%H%M%S.csv'))
+        profiler.openCsv(fname)
+        profiler.attach(display)
+        profiler.enabled = True
+        self.countDisplayed()
+        status.insertWidget(0, self.profileLabel, 1)
+        self.profileLabel.show()
+        self.profileLabel.setText("Profiling to %s" % fname)
+
+    def showFrameProfile(self, kind, seconds, phases):
+        self.profileLabel.setText(self.profiler.summary(kind, seconds, phases))
+
+    def countDisplayed(self):
+        """Count triangles and objects of the parts displayed (for profiler)."""
+        triangles = 0
+        objects = 0
+        for uid in self.drawList:
+            entry = self._aisDict.get(uid)
+            if entry is None:
+                continue
+            n = self._triangleDict.get(uid)
+            if n is None:
+                n = self._triangleDict[uid] = meshing.triangleCount(entry[1])
+            triangles += n
+            objects += 1
+        self._displayedCounts = (triangles, objects + len(self._wpPresentations))
+
+    def isHistoryPinned(self, uid):
+        """Return True if part (uid) must not be spilled by history.
+
+        Drawn and active parts are in use. Prototypes and their instances
+        share a TShape, which a spilled copy wouldn't (see sessionIndex)
+        and which the other instances would hold in memory anyway."""
+        return (uid in self.drawList or uid == self.activePartUID
+                or uid in self._instanceDict or uid in self._prototypeDict)
+
+    def partSpilled(self, uid):
+        """Drop the presentation of ancestor (uid), spilled by history."""
+        if uid in self._aisDict:
+            self.removePartPresentation(uid, self.canva._display.Context, False)
+
+    def printHistoryStats(self):
+        print(self.history.report())
+
+    def setHistoryBudget(self):
+        """Set memory budget (MB) of the ancestors of modified parts."""
+        budget, OK = QInputDialog.getInt(self, 'Input Dialog',
+                                         'Memory budget for part history (MB)',
+                                         self.history.budget // 2**20, 0)
+        if OK:
+            self.history.budget = budget * 2**20
+            self.history.fitBudget()
+            sbText = "Part history budget set to %i MB" % budget
+            self.statusBar().showMessage(sbText, 5000)
+
+    def toggleImportTrace(self):
+        self.importTracing = not self.importTracing
+        sbText = "Import trace %s" % ('on' if self.importTracing else 'off')
+        self.statusBar().showMessage(sbText, 5000)
+
     def launchCalc(self):
         if not self.calculator:
             self.calculator = rpnCalculator.Calculator(self)
@@ -468,8 +775,7 @@ class MainWindow(QMainWindow):
                 self._transparencyDict[uid] = transp
             if not name:
                 name = self._nameDict[ancestor] # Keep ancestor name
-            if ancestor in self.drawList:
-                self.drawList.remove(ancestor)  # Remove ancestor from draw list
+            self.drawList.discard(ancestor)  # Remove ancestor from draw list
         if not name:
             name = 'Part'   # Default name
         # Update appropriate dictionaries
@@ -486,6 +792,8 @@ class MainWindow(QMainWindow):
             self.addItemToTreeView(name, uid)
             # Make new part active
             self.setActivePart(uid)
+            if ancestor:
+                self.history.record(uid, ancestor)
         elif typ == 'a':
             self._assyDict[uid] = objct  # TopLoc_Location
             # add item to treeView
@@ -501,16 +809,38 @@ class MainWindow(QMainWindow):
             # Make new workplane active
             self.setActiveWp(uid)
         self._nameDict[uid] = name
-        # Add new uid to draw list and sync w/ treeView
-        self.drawList.append(uid)
-        self.syncCheckedToDrawList()
+        self.registry.setParent(uid, 0)  # (see addItemToTreeView)
+        # Add new uid to draw list (treeView syncs w/ it)
+        self.drawList.add(uid)
         return uid
 
+    def getPrototypeUID(self, uid):
+        """Return uid of the prototype of part (uid).
+
+        Instances of a prototype share its TShape, differing only in their
+        location. A part which is not an instance is its own prototype."""
+        return self._prototypeDict.get(uid, uid)
+
+    def prototypeUIDs(self, uids):
+        """Return {prototypeUID: [uids]} grouping part uids by prototype.
+
+        Work which depends only on the shape (not its location), such as
+        meshing or export of the geometry, need only be done once for each
+        prototype."""
+        groups = {}
+        for uid in uids:
+            groups.setdefault(self.getPrototypeUID(uid), []).append(uid)
+        return groups
+
     def addItemToTreeView(self, name, uid):
+        if self.assyModel is not None:
+            self.assyModel.addNode(uid, 0, name, checked=True)
+            return
         itemName = [name, str(uid)]
         item = QTreeWidgetItem(self.treeViewRoot, itemName)
         item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
         item.setCheckState(0, Qt.Checked)
+        self._itemDict[uid] = item
 
     def appendToStack(self):  # called when <ret> is pressed on line edit
         self.lineEditStack.append(self.lineEdit.text())
@@ -593,106 +923,351 @@ class MainWindow(QMainWindow):
         self.canva._display.FitAll()
 
     def eraseAll(self):
-        context = self.canva._display.Context
-        context.RemoveAll(True)
-        self.drawList = []
-        self.syncCheckedToDrawList()
+        self.removeAllPresentations()
+        self.drawList.clear()
 
     def redraw(self):
+        """Display the parts and workplanes in drawList (only them).
+
+        With batchedRedraw, all changes are made without updating the
+        viewer, which is then updated once. Otherwise, as before batching,
+        the viewer is updated after each change (several times per part)."""
         context = self.canva._display.Context
-        if not self.registeredCallback:
-            self.canva._display.SetSelectionModeNeutral()
-            context.SetAutoActivateSelection(True)
-        context.RemoveAll(True)
-        for uid in self.drawList:
-            if uid in self._partDict.keys():
-                if uid in self._transparencyDict.keys():
-                    transp = self._transparencyDict[uid]
-                else:
-                    transp = 0.0
-                color = self._colorDict[uid]
-                aisShape = AIS_Shape(self._partDict[uid])
-                context.Display(aisShape, True)
-                context.SetColor(aisShape, color, True)
+        update = not self.batchedRedraw
+        profiler = self.profiler
+        with profiler.frame('redraw'):
+            self.endNavigation()
+            if not self.registeredCallback:
+                self.canva._display.SetSelectionModeNeutral()
+                context.SetAutoActivateSelection(True)
+            with profiler.phase('hide'):
+                for aisObj in self._wpPresentations:
+                    context.Remove(aisObj, False)
+                self._wpPresentations = []
+                self.removeTransients(context)
+                self._pendingDraw = set()  # all of drawList is redrawn
+                self.drawTimer.stop()
+                for uid in list(self._aisDict):
+                    if uid not in self.drawList or uid not in self._partDict:
+                        self.hidePart(uid, context, update)
+            with profiler.phase('parts'):
+                for uid in self.drawList:
+                    if uid in self._partDict.keys():
+                        self.displayPart(uid, context, update)
+            with profiler.phase('workplanes'):
+                for uid in self.drawList:
+                    if uid in self._wpDict.keys():
+                        self.displayWp(uid, context, update)
+            if not update:
+                with profiler.phase('update'):
+                    context.UpdateCurrentViewer()
+            if self.lodEnabled:
+                for uid in self.drawList:
+                    entry = self._aisDict.get(uid)
+                    if entry is not None and entry[4] is None:  # not instanced
+                        self.lod.request(uid, *entry[1:4])
+                if self.lod.hasPending():
+                    self.lodTimer.start()
+            with profiler.phase('release'):
+                self.releaseHiddenParts()
+            if profiler.enabled:
+                self.countDisplayed()
+
+    def displayWp(self, uid, context, update=True):
+        """Display workplane (uid): border, construction lines & profile."""
+        wp = self._wpDict[uid]
+        border = wp.border
+        if uid == self.activeWpUID:
+            borderColor = Quantity_Color(Quantity_NOC_DARKGREEN)
+        else:
+            borderColor = Quantity_Color(Quantity_NOC_GRAY)
+        aisBorder = AIS_Shape(border)
+        self._wpPresentations.append(aisBorder)
+        context.Display(aisBorder, update)
+        context.SetColor(aisBorder, borderColor, update)
+        transp = 0.8  # 0.0 <= transparency <= 1.0
+        context.SetTransparency(aisBorder, transp, update)
+        drawer = aisBorder.DynamicHilightAttributes()
+        context.HilightWithColor(aisBorder, drawer, update)
+        clClr = Quantity_Color(Quantity_NOC_MAGENTA1)
+        for cline in wp.clines:
+            geomline = wp.geomLineBldr(cline)
+            aisline = AIS_Line(geomline)
+            aisline.SetOwner(geomline)
+            drawer = aisline.Attributes()
+            # asp parameters: (color, type, width)
+            asp = Prs3d_LineAspect(clClr, 2, 1.0)
+            drawer.SetLineAspect(asp)
+            aisline.SetAttributes(drawer)
+            self._wpPresentations.append(aisline)
+            context.Display(aisline, False)  # (see comment below)
+            # 'False' above enables 'context' mode display & selection
+        pntlist = wp.intersectPts()  # type <gp_Pnt>
+        for point in pntlist:
+            self.canva._display.DisplayShape(point)
+        for ccirc in wp.ccircs:
+            aiscirc = AIS_Circle(wp.convert_circ_to_geomCirc(ccirc))
+            drawer = aisline.Attributes()
+            # asp parameters: (color, type, width)
+            asp = Prs3d_LineAspect(clClr, 2, 1.0)
+            drawer.SetLineAspect(asp)
+            aiscirc.SetAttributes(drawer)
+            self._wpPresentations.append(aiscirc)
+            context.Display(aiscirc, False)  # (see comment below)
+            # 'False' above enables 'context' mode display & selection
+        for edge in wp.edgeList:
+            self.canva._display.DisplayShape(edge, color="WHITE")
+        if update:
+            self.canva._display.Repaint()
+
+    def releaseHiddenParts(self, uids=None):
+        """Release the loaded shapes of deferred parts which aren't drawn.
+
+        Only parts (uids) are considered, if given (by default, the deferred
+        parts loaded since they were last released, see PartView).
+        They are loaded again when needed, so memory tracks what is visible."""
+        if uids is None:
+            uids = list(self.registry.loaded)
+        for uid in uids:
+            if (uid not in self.drawList and uid != self.activePartUID
+                    and uid in self._partDict):
+                self._partDict.release(uid)
+
+    def drawListChanged(self, added, removed):
+        """Apply a change of drawList (uids added & removed) to the treeView
+
+        right away, and to the viewer when the GUI is idle (redrawChanged),
+        unless a redraw comes first."""
+        uids = added + removed
+        self.registry.setVisible(added, True)
+        self.registry.setVisible(removed, False)
+        self.syncCheckedToDrawList(uids)
+        self._pendingDraw.update(uids)
+        self.drawTimer.start()
+
+    def redrawChanged(self):
+        """Display or hide only the parts & wps (un)drawn since the viewer
+        was last updated (see drawListChanged)."""
+        uids = self._pendingDraw
+        self._pendingDraw = set()
+        if not uids:
+            return
+        context = self.canva._display.Context
+        update = not self.batchedRedraw
+        profiler = self.profiler
+        with profiler.frame('drawList'):
+            self.endNavigation()
+            with profiler.phase('hide'):
+                for uid in uids:
+                    if uid in self._aisDict and (uid not in self.drawList
+                                                 or uid not in self._partDict):
+                        self.hidePart(uid, context, update)
+            with profiler.phase('parts'):
+                shown = [uid for uid in uids
+                         if uid in self.drawList and uid in self._partDict]
+                for uid in shown:
+                    self.displayPart(uid, context, update)
+            if any(uid in self._wpDict for uid in uids):
+                with profiler.phase('workplanes'):
+                    for aisObj in self._wpPresentations:
+                        context.Remove(aisObj, False)
+                    self._wpPresentations = []
+                    self.removeTransients(context)
+                    for uid in self.drawList:
+                        if uid in self._wpDict:
+                            self.displayWp(uid, context, update)
+            if not update:
+                with profiler.phase('update'):
+                    context.UpdateCurrentViewer()
+            if self.lodEnabled:
+                for uid in shown:
+                    entry = self._aisDict.get(uid)
+                    if entry is not None and entry[4] is None:  # not instanced
+                        self.lod.request(uid, *entry[1:4])
+                if self.lod.hasPending():
+                    self.lodTimer.start()
+            with profiler.phase('release'):
+                self.releaseHiddenParts(uids)
+            if profiler.enabled:
+                self.countDisplayed()
+
+    def displayPart(self, uid, context, update=True):
+        """Display part (uid) in context with its color and transparency.
+
+        The presentation of each part is kept (in self._aisDict) once made,
+        so that only what changed since it was last displayed is updated.
+        If update is False, the viewer is left for the caller to update."""
+        transp = self.registry.transparencyOf(uid)
+        rgb = self.registry.rgbOf(uid)
+        color = shapeio.colorFromTuple(rgb)
+        shape = self._partDict[uid]
+        entry = self._aisDict.get(uid)
+        if entry is not None and (not entry[1].IsEqual(shape) or
+                                  entry[4] is not None and
+                                  (rgb, transp) != (entry[2], entry[3])):
+            # Part was modified or moved (or an instance was recolored):
+            # its presentation must be remade
+            self.removePartPresentation(uid, context, False)
+            entry = None
+        if entry is None:
+            refKey = self.instanceRefKey(uid, shape, rgb, transp)
+            if refKey is not None:
+                aisShape = AIS_ConnectedInteractive()
+                aisShape.Connect(self.instanceRef(refKey, shape, color, transp),
+                                 shape.Location().Transformation())
+            else:
+                aisShape = AIS_Shape(shape)
+            # Owner marks it as a part presentation (see removeTransients)
+            aisShape.SetOwner(TCollection_HAsciiString(str(uid)))
+            context.Display(aisShape, update)
+            if refKey is None:  # instances show the reference's attributes
+                context.SetColor(aisShape, color, update)
                 # Set shape transparency, a float from 0.0 to 1.0
-                context.SetTransparency(aisShape, transp, True)
+                context.SetTransparency(aisShape, transp, update)
                 drawer = aisShape.DynamicHilightAttributes()
-                context.HilightWithColor(aisShape, drawer, True)
-            elif uid in self._wpDict.keys():
-                wp = self._wpDict[uid]
-                border = wp.border
-                if uid == self.activeWpUID:
-                    borderColor = Quantity_Color(Quantity_NOC_DARKGREEN)
-                else:
-                    borderColor = Quantity_Color(Quantity_NOC_GRAY)
-                aisBorder = AIS_Shape(border)
-                context.Display(aisBorder, True)
-                context.SetColor(aisBorder, borderColor, True)
-                transp = 0.8  # 0.0 <= transparency <= 1.0
-                context.SetTransparency(aisBorder, transp, True)
-                drawer = aisBorder.DynamicHilightAttributes()
-                context.HilightWithColor(aisBorder, drawer, True)
-                clClr = Quantity_Color(Quantity_NOC_MAGENTA1)
-                for cline in wp.clines:
-                    geomline = wp.geomLineBldr(cline)
-                    aisline = AIS_Line(geomline)
-                    aisline.SetOwner(geomline)
-                    drawer = aisline.Attributes()
-                    # asp parameters: (color, type, width)
-                    asp = Prs3d_LineAspect(clClr, 2, 1.0)
-                    drawer.SetLineAspect(asp)
-                    aisline.SetAttributes(drawer)
-                    context.Display(aisline, False)  # (see comment below)
-                    # 'False' above enables 'context' mode display & selection
-                pntlist = wp.intersectPts()  # type <gp_Pnt>
-                for point in pntlist:
-                    self.canva._display.DisplayShape(point)
-                for ccirc in wp.ccircs:
-                    aiscirc = AIS_Circle(wp.convert_circ_to_geomCirc(ccirc))
-                    drawer = aisline.Attributes()
-                    # asp parameters: (color, type, width)
-                    asp = Prs3d_LineAspect(clClr, 2, 1.0)
-                    drawer.SetLineAspect(asp)
-                    aiscirc.SetAttributes(drawer)
-                    context.Display(aiscirc, False)  # (see comment below)
-                    # 'False' above enables 'context' mode display & selection
-                for edge in wp.edgeList:
-                    self.canva._display.DisplayShape(edge, color="WHITE")
-                self.canva._display.Repaint()
+                context.HilightWithColor(aisShape, drawer, update)
+            # keep a copy of shape, as shape itself may be moved in place
+            self._aisDict[uid] = [aisShape, shape.Located(shape.Location()),
+                                  rgb, transp, refKey]
+            return
+        aisShape = entry[0]
+        if not context.IsDisplayed(aisShape):
+            context.Display(aisShape, update)
+        if rgb != entry[2]:
+            context.SetColor(aisShape, color, update)
+            entry[2] = rgb
+            self.lod.forget(uid, context)
+        if transp != entry[3]:
+            context.SetTransparency(aisShape, transp, update)
+            entry[3] = transp
+            self.lod.forget(uid, context)
+
+    def instanceRefKey(self, uid, shape, rgb, transp):
+        """Return key of the reference presentation part (uid) can share.
+
+        Instances of a prototype (which share its TShape) with the same
+        color and transparency are all displayed (as AIS_ConnectedInteractive)
+        from one reference presentation, so it is tessellated and uploaded
+        once. Return None if part (uid) is not to be displayed this way."""
+        protoUID = self._prototypeDict.get(uid)
+        if not self.instancedDisplay or protoUID is None:
+            return None
+        key = (protoUID, rgb, transp)
+        ref = self._instanceRefs.get(key)
+        if ref is not None and not ref[0].Shape().IsPartner(shape):
+            return None  # part no longer shares the prototype's TShape
+        return key
+
+    def instanceRef(self, key, shape, color, transp):
+        """Return reference presentation (key), making it if needed.
+
+        The reference is not displayed itself. It holds shape, not located."""
+        ref = self._instanceRefs.get(key)
+        if ref is None:
+            aisShape = AIS_Shape(shape.Located(TopLoc_Location()))
+            aisShape.SetColor(color)
+            aisShape.SetTransparency(transp)
+            ref = self._instanceRefs[key] = [aisShape, 0]
+        ref[1] += 1
+        return ref[0]
+
+    def hidePart(self, uid, context, update=True):
+        """Stop displaying part (uid).
+
+        Its presentation is erased but kept, to be displayed again at no
+        cost, unless the part is gone or is deferred (its shape is then
+        released, see releaseHiddenParts, and so is its presentation)."""
+        aisShape = self._aisDict[uid][0]
+        if uid in self._partDict and self._partDict.deferred(uid) is None:
+            context.Erase(aisShape, update)
+            self.lod.forget(uid, context)  # built again if drawn again
+        else:
+            self.removePartPresentation(uid, context, update)
+
+    def removePartPresentation(self, uid, context, update=True):
+        """Remove presentation of part (uid) from context and self._aisDict."""
+        aisShape, shape, rgb, transp, refKey = self._aisDict.pop(uid)
+        self._triangleDict.pop(uid, None)
+        context.Remove(aisShape, update)
+        self.lod.forget(uid, context)
+        if refKey is not None:
+            ref = self._instanceRefs[refKey]
+            ref[1] -= 1
+            if ref[1] <= 0:
+                del self._instanceRefs[refKey]
+
+    def removeTransients(self, context):
+        """Remove presentations displayed other than by redraw.
+
+        (such as those displayed with DisplayShape) Part presentations are
+        recognized by their owner."""
+        aisList = AIS_ListOfInteractive()
+        context.ObjectsInside(aisList, AIS_KOI_None, -1)
+        it = AIS_ListIteratorOfListOfInteractive(aisList)
+        while it.More():
+            aisObj = it.Value()
+            if not aisObj.HasOwner():
+                context.Remove(aisObj, False)
+            it.Next()
+
+    def meshParts(self, uids):
+        """Tessellate the parts (uids) not yet displayed, ahead of display.
+
+        Instances of a prototype share its TShape, so only one is meshed.
+        Return the number of parts meshed."""
+        groups = self.prototypeUIDs(uid for uid in uids if uid in self._partDict
+                                    and uid not in self._aisDict)
+        shapes = [self._partDict[group[0]] for group in groups.values()]
+        drawer = self.canva._display.Context.DefaultDrawer()
+        meshing.meshShapes(shapes, drawer)
+        return len(shapes)
+
+    def removeAllPresentations(self):
+        """Remove everything from the viewer, including kept presentations."""
+        self.canva._display.Context.RemoveAll(True)
+        self._aisDict = {}
+        self._instanceRefs = {}
+        self._triangleDict = {}
+        self._wpPresentations = []
+        self.lod.clear()
+
+    def viewChanged(self):
+        """Show parts at coarse levels while the view is navigated."""
+        if not self.lodEnabled:
+            return
+        if not self.lod.navigating:
+            self.lod.beginNavigation(self.canva._display,
+                                     {uid: entry[0]
+                                      for uid, entry in self._aisDict.items()})
+        self.navTimer.start()
+
+    def endNavigation(self):
+        self.navTimer.stop()
+        self.lod.endNavigation(self.canva._display)
+        if self.lodEnabled and self.lod.hasPending():
+            self.lodTimer.start()
+
+    def buildLods(self):
+        """Build coarse levels of a few parts (while the GUI is idle)."""
+        if self.lod.navigating or not self.lod.buildSome(self.canva._display.Context):
+            self.lodTimer.stop()  # restarted when navigation ends
+
+    # The treeView and the viewer follow drawList (see drawListChanged)
 
     def drawAll(self):
-        self.drawList = []
-        for k in self._partDict:
-            self.drawList.append(k)
-        for k in self._wpDict:
-            self.drawList.append(k)
-        self.syncCheckedToDrawList()
-        self.redraw()
+        self.drawList.replace(list(self._partDict) + list(self._wpDict))
 
     def drawOnlyActivePart(self):
-        self.eraseAll()
-        uid = self.activePartUID
-        self.drawList.append(uid)
-        self.canva._display.DisplayShape(self._partDict[uid])
-        self.syncCheckedToDrawList()
-        self.redraw()
+        self.drawOnlyPart(self.activePartUID)
 
     def drawOnlyPart(self, key):
-        self.eraseAll()
-        self.drawList.append(key)
-        self.syncCheckedToDrawList()
-        self.redraw()
+        self.drawList.replace([key])
 
     def drawAddPart(self, key): # Add part to drawList
-        self.drawList.append(key)
-        self.syncCheckedToDrawList()
-        self.redraw()
+        self.drawList.add(key)
 
     def drawHidePart(self, key): # Remove part from drawList
-        if key in self.drawList:
-            self.drawList.remove(key)
-            self.syncCheckedToDrawList()
-            self.redraw()
+        self.drawList.discard(key)
 
     #############################################
     #
@@ -700,7 +1275,7 @@ class MainWindow(QMainWindow):
     #
     #############################################
 
-    def loadStep(self):
+    def loadStep(self, lazy=False):
         """Bring in a step file as a 'disposable' treelib.Tree() structure.
 
         Each node of the tree contains the following tuple:
@@ -718,6 +1293,13 @@ class MainWindow(QMainWindow):
         Each QTreeWidgetItem is required to have a unique identifier. This means
         that multiple instances of the same CAD geometry will each have different
         uid's.
+
+        If lazy is True, the parts of assemblies are entered in self._partDict
+        as stepXD.LazyShape objects, so their geometry is only extracted
+        (and tessellated) when the part is first drawn or otherwise used.
+        Lazily loaded parts start out unchecked (not in the drawList).
+
+        The ImportStats of the import are appended to self.importReports.
         """
         prompt = 'Select STEP file to import'
         fnametuple = QFileDialog.getOpenFileName(None, prompt, './',
@@ -727,59 +1309,220 @@ class MainWindow(QMainWindow):
         if not fname:
             print("Load step cancelled")
             return
-        name = os.path.basename(fname).split('.')[0]
         nextUID = self._currentUID
-        stepImporter = stepXD.StepImporter(fname, nextUID)
+        stepImporter = stepXD.StepImporter(fname, nextUID, self.stepCache,
+                                           lazy=lazy, tracing=self.importTracing)
         self.doc = stepImporter.doc  # <class 'OCC.Core.TDocStd.TDocStd_Document'>
-        tree = stepImporter.tree
+        stats = stepImporter.stats
+        with stats.phase('Qt population'):
+            self.addStepTree(stepImporter.tree, draw=not lazy)
+        with stats.phase('meshing'):
+            stats.setCount('meshed parts', self.meshParts(self.drawList))
+        with stats.phase('first redraw'):
+            self.redraw()
+        self.addImportReport(stats)
+
+    def loadStepLazy(self):
+        self.loadStep(lazy=True)
+
+    def loadStepBatch(self):
+        """Bring in several step files at once, each in its own process.
+
+        The files are parsed and transferred concurrently by a pool of
+        worker processes (see stepXD.ImportBatch), polled by importTimer so
+        the GUI stays responsive. Each worker returns its tree as picklable
+        records whose uids start at 1. Once all are done, the records are
+        merged (in the order the files were selected) with uids offset
+        by self._currentUID, so they never collide with existing uids.
+        An ImportStats is reported for each file, plus one for the batch.
+        """
+        prompt = 'Select STEP files to import'
+        fnametuple = QFileDialog.getOpenFileNames(None, prompt, './',
+                                                  "STEP files (*.stp *.STP *.step)")
+        fnames, _ = fnametuple
+        if not fnames:
+            print("Load step cancelled")
+            return
+        if self.importBatch is not None:
+            self.statusBar().showMessage("Previous batch import still running", 5000)
+            return
+        self.importBatch = stepXD.ImportBatch(fnames, self.stepCache, self.importTracing)
+        self.statusBar().showMessage("Importing %i STEP files" % len(fnames))
+        self.importTimer.start()
+
+    def pollImportBatch(self):
+        """Report the progress of importBatch, then merge it once complete."""
+        batch = self.importBatch
+        for fname, error in batch.poll():
+            if error is not None:
+                logger.error("Unable to import %s: %s", fname, error)
+            sbText = "Imported %i of %i STEP files" % (batch.nDone, len(batch.fnames))
+            self.statusBar().showMessage(sbText)
+        if batch.isRunning():
+            return
+        self.importTimer.stop()
+        self.importBatch = None
+        results = batch.results
+        batchStats = batch.stats
+        for fname in batch.fnames:
+            if fname in results:
+                records, statsDict = results[fname]
+                stats = ImportStats.fromDict(statsDict)
+                with stats.phase('tree build'):
+                    tree = stepXD.recordsToTree(records, self._currentUID)
+                with stats.phase('Qt population'):
+                    self.addStepTree(tree)
+                self.addImportReport(stats)
+        self.statusBar().showMessage("Loaded %i of %i STEP files"
+                                     % (len(results), len(batch.fnames)), 5000)
+        with batchStats.phase('meshing'):
+            batchStats.setCount('meshed parts', self.meshParts(self.drawList))
+        with batchStats.phase('first redraw'):
+            self.redraw()
+        batchStats.setCount('files', len(results))
+        self.addImportReport(batchStats)
+
+    def loadStepIncremental(self):
+        """Bring in a step file, showing its parts as they are discovered.
+
+        The treeView and the display are filled in batches of
+        self.stepBatchSize nodes while the import proceeds. The import can
+        be cancelled partway, leaving the nodes imported so far in place.
+        """
+        prompt = 'Select STEP file to import'
+        fnametuple = QFileDialog.getOpenFileName(None, prompt, './',
+                                                 "STEP files (*.stp *.STP *.step)")
+        fname, _ = fnametuple
+        if not fname:
+            print("Load step cancelled")
+            return
+        stepImporter = stepXD.StepImporter(fname, self._currentUID,
+                                           self.stepCache, incremental=True,
+                                           tracing=self.importTracing)
+        stats = stepImporter.stats
+        progress = QProgressDialog("Importing %s" % os.path.basename(fname),
+                                   "Cancel", 0, 0, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        context = self.canva._display.Context
+        treeItems = {}  # uid:asyPrtTreeItem (used temporarily during unpack)
+        newParts = []
+        cancelled = False
+        for n, node in enumerate(stepImporter.iterNodes(), 1):
+            with stats.phase('Qt population'):
+                self.addStepNode(node, treeItems)
+            if not node.data['a']:
+                newParts.append(node.identifier)
+            if not n % self.stepBatchSize:
+                with stats.phase('meshing'):
+                    stats.count('meshed parts', self.meshParts(newParts))
+                with stats.phase('progressive display'):
+                    for uid in newParts:
+                        self.displayPart(uid, context, False)
+                    newParts = []
+                    self.canva._display.Repaint()
+                progress.setLabelText("Importing %s\n%i items loaded"
+                                      % (os.path.basename(fname), n))
+                QApplication.processEvents()
+                if progress.wasCanceled():
+                    cancelled = True
+                    break
+        progress.close()
+        self._changedItems = []  # items were added in sync with drawList
+        # Uids dispensed by the importer are spoken for, even if not used
+        self._currentUID = stepImporter._currentUID
+        if self.activePartUID in self._partDict:
+            self.activePart = self._partDict[self.activePartUID]
+        self.doc = stepImporter.doc
+        if cancelled:
+            sbText = "Import cancelled after %i items" % len(treeItems)
+        else:
+            sbText = "Imported %i items" % len(treeItems)
+        self.statusBar().showMessage(sbText, 5000)
+        with stats.phase('meshing'):
+            stats.count('meshed parts', self.meshParts(self.drawList))
+        with stats.phase('first redraw'):
+            self.redraw()
+        self.addImportReport(stats)
+
+    def addStepTree(self, tree, draw=True):
+        """Add the assemblies & parts of tree (from StepImporter) to self.
+
+        Update the various dictionaries, the treeView and (if draw is True)
+        the drawList. Set self._currentUID to the highest uid in tree."""
+        if tree.root is None:
+            return
         tempTreeDict = {}   # uid:asyPrtTreeItem (used temporarily during unpack)
         treedump = tree.expand_tree(mode=tree.DEPTH)
-        for uid in treedump:  # type(uid) == int
-            node = tree.get_node(uid)
-            name = node.tag
-            itemName = [name, str(uid)]
-            parentUid = node.bpointer
-            if node.data['a']:  # Assembly
-                if not parentUid: # This is the top level item
-                    parentItem = self.treeViewRoot
-                else:
-                    parentItem = tempTreeDict[parentUid]
+        with self.drawList.batch():
+            for uid in treedump:  # type(uid) == int
+                self.addStepNode(tree.get_node(uid), tempTreeDict, draw)
+        keyList = tempTreeDict.keys()
+        keyList = list(keyList)
+        keyList.sort()
+        maxUID = keyList[-1]
+        self._currentUID = maxUID
+        if self.activePartUID in self._partDict:
+            self.activePart = self._partDict[self.activePartUID]
+        self._changedItems = []  # items were added in sync with drawList
+
+    def addStepNode(self, node, treeItems, draw=True):
+        """Add an assembly or part node (from StepImporter) to self.
+
+        treeItems is a dict {uid: QTreeWidgetItem} of the nodes added so
+        far, in which the parent of node must already be present. The new
+        item (None with the AssyTreeView) is added to it. The last part added becomes the active part
+        (the caller is responsible for updating self.activePart)."""
+        uid = node.identifier
+        name = node.tag
+        itemName = [name, str(uid)]
+        parentUid = node.bpointer
+        self.registry.setParent(uid, parentUid or 0)
+        if self.assyModel is not None:
+            self.assyModel.addNode(uid, parentUid or 0, name,
+                                   assy=node.data['a'], checked=draw)
+            parentItem = item = None
+        elif not parentUid: # This is the top level item
+            parentItem = self.treeViewRoot
+        else:
+            parentItem = treeItems[parentUid]
+        if node.data['a']:  # Assembly
+            if parentItem is not None:
                 item = QTreeWidgetItem(parentItem, itemName)
                 item.setFlags(item.flags() | Qt.ItemIsTristate | Qt.ItemIsUserCheckable)
                 self.treeView.expandItem(item)
-                tempTreeDict[uid] = item
-                Loc = node.data['l'] # Location object
-                self._assyDict[uid] = Loc
-            else:   # Part
-                # add item to asyPrtTree treeView
-                if not parentUid: # This is the top level item
-                    parentItem = self.treeViewRoot
-                else:
-                    parentItem = tempTreeDict[parentUid]
+                self._itemDict[uid] = item
+            treeItems[uid] = item
+            Loc = node.data['l'] # Location object
+            self._assyDict[uid] = Loc
+        else:   # Part
+            # add item to asyPrtTree treeView
+            if parentItem is not None:
                 item = QTreeWidgetItem(parentItem, itemName)
                 item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
-                item.setCheckState(0, Qt.Checked)
-                tempTreeDict[uid] = item
-                color = node.data['c']
-                shape = node.data['s']
-                # Update dictionaries
-                self._partDict[uid] = shape
-                self._nameDict[uid] = name
-                if color:
-                    c = OCC.Display.OCCViewer.rgb_color(color.Red(), color.Green(), color.Blue())
+                if draw:
+                    item.setCheckState(0, Qt.Checked)
                 else:
-                    c = OCC.Display.OCCViewer.rgb_color(.2, .1, .1)   # default color
-                self._colorDict[uid] = c
-                self.activePartUID = uid           # Set as active part
-                self.activePart = shape
-                self.drawList.append(uid)   # Add to draw list
-
-        keyList = tempTreeDict.keys()
-        keyList = list(keyList)
-        keyList.sort()
-        maxUID = keyList[-1]
-        self._currentUID = maxUID
-        self.redraw()
+                    item.setCheckState(0, Qt.Unchecked)
+                self._itemDict[uid] = item
+            treeItems[uid] = item
+            color = node.data['c']
+            shape = node.data['s']  # TopoDS_Shape or stepXD.LazyShape
+            # Update dictionaries
+            self._partDict[uid] = shape
+            self._nameDict[uid] = name
+            if color:
+                c = OCC.Display.OCCViewer.rgb_color(color.Red(), color.Green(), color.Blue())
+            else:
+                c = OCC.Display.OCCViewer.rgb_color(.2, .1, .1)   # default color
+            self._colorDict[uid] = c
+            protoUID = node.data.get('p')
+            if protoUID is not None:  # instance of a shared shape
+                self._prototypeDict[uid] = protoUID
+                self._instanceDict.setdefault(protoUID, []).append(uid)
+            self.activePartUID = uid           # Set as active part
+            if draw:
+                self.drawList.add(uid)   # Add to draw list
 
     def saveStepActPrt(self):
         prompt = 'Choose filename for step file.'
@@ -789,18 +1532,20 @@ class MainWindow(QMainWindow):
         if not fname:
             print("Save step cancelled.")
             return
-
-        # initialize the STEP exporter
-        step_writer = STEPControl_Writer()
-        Interface_Static_SetCVal("write.step.schema", "AP203")
-
-        # transfer shapes and write file
-        step_writer.Transfer(self.activePart, STEPControl_AsIs)
-        status = step_writer.Write(fname)
-        assert status == IFSelect_RetDone
+        if self.activePart is None:
+            self.statusBar().showMessage("No active part to save", 5000)
+            return
+        name = self._nameDict.get(self.activePartUID, "Part")
+        snapshot = stepExport.snapshotShape(self.activePart, name)
+        self.startExport(fname, 'shape', snapshot)
 
     def saveStep(self):
-        """Export self.doc to STEP file."""
+        """Export the session (all assemblies and parts) to STEP file.
+
+        A new XCAF document is built from the session (see sessionTree), so
+        no STEP file needs to have been loaded. Parts which share the shape
+        of their prototype are written as references to a single shape.
+        The export runs in the background (see startExport)."""
 
         prompt = 'Choose filename for step file.'
         fnametuple = QFileDialog.getSaveFileName(None, prompt, './',
@@ -809,41 +1554,327 @@ class MainWindow(QMainWindow):
         if not fname:
             print("Save step cancelled.")
             return
-        # Reconstruct XCAFDoc related code from stepXD.StepImporter
-        labels = TDF_LabelSequence()
-        shape_tool = XCAFDoc_DocumentTool_ShapeTool(self.doc.Main())
-        shape_tool.GetShapes(labels)
-        logger.info('Number of labels at root : %i', labels.Length())
+        name = os.path.splitext(os.path.basename(fname))[0]
+        tree = self.sessionTree(name)
+        if tree.root is None:
+            self.statusBar().showMessage("Nothing to save", 5000)
+            return
+        snapshot = stepXD.treeToRecords(tree)
+        self.startExport(fname, 'records', snapshot)
+
+    def saveStepIncremental(self):
+        """Export the session to STEP file, like saveStep, but faster
+
+        when re-saving a session in which only a few parts have changed:
+        only the parts added, removed or changed since the previous
+        incremental save are sent to the exporter (see
+        stepExport.IncrementalExport). The STEP file is still written in
+        full."""
+        if self.incrementalExport.isRunning():
+            self.statusBar().showMessage("Previous export still running", 5000)
+            return
+        prompt = 'Choose filename for step file.'
+        fnametuple = QFileDialog.getSaveFileName(None, prompt,
+                                                 self.incrementalExport.fname or './',
+                                                 "STEP files (*.stp *.STP *.step)")
+        fname, _ = fnametuple
+        if not fname:
+            print("Save step cancelled.")
+            return
+        name = os.path.splitext(os.path.basename(fname))[0]
+        tree = self.sessionTree(name)
+        if tree.root is None:
+            self.statusBar().showMessage("Nothing to save", 5000)
+            return
+        nSent = self.incrementalExport.export(fname, tree)
+        self.exportJobs.append(self.incrementalExport)
+        self.statusBar().showMessage("Saving %s (%i parts changed, file written in full)"
+                                     % (os.path.basename(fname), nSent))
+        self.exportTimer.start()
+
+    def sessionTree(self, name):
+        """Return the assemblies & parts of the session as a treelib.Tree
+
+        in the format built by stepXD.StepImporter (see loadStep), with the
+        hierarchy shown in the treeView. Unless the treeView holds a single
+        top assembly, a top assembly (uid 0, named name) is added to hold
+        everything. Workplanes, and parts superseded by a modified version
+        (ancestors), are left out. Parts still sharing the TShape of their
+        prototype carry its uid ('p')."""
+        tree = treelib.tree.Tree()
+        ancestors = set(self._ancestorDict.values())
+        topUIDs = self.treeChildren(0)
+        if len(topUIDs) == 1 and topUIDs[0] in self._assyDict:
+            stack = [(topUIDs[0], None)]
+        else:
+            tree.create_node(name, 0, None,
+                             {'a': True, 'l': None, 'c': None, 's': None})
+            stack = [(uid, 0) for uid in reversed(topUIDs)]
+        while stack:  # (uid, parent uid)
+            uid, parentUid = stack.pop()
+            if uid in self._assyDict:
+                tree.create_node(self.treeName(uid), uid, parentUid,
+                                 {'a': True, 'l': self._assyDict[uid],
+                                  'c': None, 's': None})
+                stack.extend((child, uid)
+                             for child in reversed(self.treeChildren(uid)))
+            elif uid in self._partDict and uid not in ancestors:
+                # Deferred parts go in as is, loaded only when serialized
+                shape = self._partDict.deferred(uid) or self._partDict[uid]
+                data = {'a': False, 'l': None, 'c': self._colorDict.get(uid),
+                        's': shape}
+                protoUID = self._prototypeDict.get(uid)
+                if protoUID is not None and self.sharesPrototype(uid, protoUID):
+                    data['p'] = protoUID
+                tree.create_node(self.treeName(uid), uid, parentUid, data)
+        if len(tree) == 1 and 0 in tree:  # empty session
+            return treelib.tree.Tree()
+        return tree
+
+    def sharesPrototype(self, uid, protoUID):
+        """Return True if part (uid) still shares the TShape of its prototype.
+
+        Deferred parts are compared by source, without loading them."""
+        deferred = self._partDict.deferred(uid)
+        protoDeferred = self._partDict.deferred(protoUID)
+        if deferred is None and protoDeferred is None:
+            return self._partDict[uid].IsPartner(self._partDict[protoUID])
+        if deferred is None or protoDeferred is None:
+            return False
+        source = deferred.source()
+        return source is not None and source == protoDeferred.source()
+
+    def startExport(self, fname, writer, snapshot):
+        """Start a background export job of snapshot to fname.
+
+        Its progress is shown in the status bar. It can be cancelled with
+        cancelExports()."""
+        job = stepExport.ExportJob(fname, writer, snapshot)
+        self.exportJobs.append(job)
+        self.statusBar().showMessage("Saving %s" % os.path.basename(fname))
+        self.exportTimer.start()
+
+    def pollExportJobs(self):
+        for job in self.exportJobs:
+            basename = os.path.basename(job.fname)
+            for kind, text in job.poll():
+                if kind == 'progress':
+                    self.statusBar().showMessage("Saving %s: %s" % (basename, text))
+                elif kind == 'done':
+                    self.statusBar().showMessage("Saved %s" % basename, 5000)
+                else:
+                    logger.error(text)
+                    self.statusBar().showMessage(text, 10000)
+        self.exportJobs = [job for job in self.exportJobs if job.isRunning()]
+        if not self.exportJobs:
+            self.exportTimer.stop()
+
+    def cancelExports(self):
+        """Cancel all STEP export jobs still running."""
+        for job in self.exportJobs:
+            job.cancel()
+        if self.exportJobs:
+            sbText = "Cancelled %i STEP export(s)" % len(self.exportJobs)
+            self.statusBar().showMessage(sbText, 5000)
+        self.exportJobs = []
+        self.exportTimer.stop()
+
+    def saveSession(self):
+        """Save the session to a native session file (see session.py)."""
+        prompt = 'Choose filename for session file.'
+        fnametuple = QFileDialog.getSaveFileName(None, prompt, './',
+                                                 "cadViewer sessions (*%s)"
+                                                 % session.SUFFIX)
+        fname, _ = fnametuple
+        if not fname:
+            print("Save session cancelled.")
+            return
+        if not fname.endswith(session.SUFFIX):
+            fname += session.SUFFIX
+        index, shapes = self.sessionIndex()
         try:
-            rootlabel = labels.Value(1) # First label at root
-        except RuntimeError:
+            session.writeSession(fname, index, shapes)
+        except OSError as e:
+            logger.error("Unable to save %s: %s", fname, e)
+            self.statusBar().showMessage("Unable to save %s: %s" % (fname, e), 10000)
             return
-        name = rootlabel.GetLabelName()
-        logger.info('Name of root label: %s', name)
-        isAssy = shape_tool.IsAssembly(rootlabel)
-        logger.info("First label at root holds an assembly? %s", isAssy)
-
-        # Modify self.doc by adding active part to rootlabel.
-        #Standard_Boolean expand = Standard_False; //default
-        #TDF_Label aLabel = myAssembly->AddComponent (aShape [,expand]);
-        newLabel = shape_tool.AddComponent(rootlabel, self.activePart, True)
-        #set a name to newlabel (as a reminder using OCAF), use:
-        #TCollection_ExtendedString aName ...;
-        #// contains the desired name for this Label (ASCII)
-        #TDataStd_Name::Set (aLabel, aName);
-        newName = TCollection_ExtendedString(self._nameDict[self.activePartUID])
-        TDataStd_Name.Set(newLabel, newName)
-        logger.info('Name of new part: %s', newName)
-        #myAssembly->UpdateAssemblies();
-        shape_tool.UpdateAssemblies()
-
-        # initialize the STEP exporter
-        step_writer = STEPCAFControl_Writer()
-
-        # transfer shapes and write file
-        step_writer.Transfer(self.doc)
-        status = step_writer.Write(fname)
-        assert status == IFSelect_RetDone
+        sbText = "Saved %i parts (%i shapes) to %s" % (len(index['parts']), len(shapes),
+                                                       os.path.basename(fname))
+        self.statusBar().showMessage(sbText, 5000)
+
+    def sessionIndex(self):
+        """Return (index, shapes) of the session, for session.writeSession.
+
+        Parts which share the TShape of their prototype share its shape.
+        Deferred parts are not loaded here (see writeSession)."""
+        asyPrtTree = []  # [uid, parent uid, name] of treeView items, parents first
+        stack = [(uid, 0) for uid in reversed(self.treeChildren(0))]
+        while stack:  # (uid, parent uid)
+            uid, parentUid = stack.pop()
+            asyPrtTree.append([uid, parentUid, self.treeName(uid)])
+            stack.extend((child, uid)
+                         for child in reversed(self.treeChildren(uid)))
+        shapes = {}  # k = shape key, v = shape (not located) or ArchiveShape
+        parts = {}   # k = uid, v = [shape key, location tuple]
+        for uid in self._partDict:
+            deferred = self._partDict.deferred(uid)
+            if (isinstance(deferred, session.ArchiveShape)
+                    and deferred.archive is self.sessionArchive):
+                # Copied from the archive as is, without loading it
+                key = deferred.key
+                shapes.setdefault(key, deferred)
+                parts[uid] = [key, shapeio.locToTuple(deferred.location())]
+                continue
+            protoUID = self._prototypeDict.get(uid)
+            if protoUID is not None and self.sharesPrototype(uid, protoUID):
+                key = 'p%i' % protoUID
+            else:
+                key = 'u%i' % uid
+            if deferred is not None:
+                # Loaded (if need be) only while writeSession serializes it
+                shapes.setdefault(key, deferred)
+                parts[uid] = [key, shapeio.locToTuple(deferred.location())]
+                continue
+            shape = self._partDict[uid]
+            if key not in shapes:
+                shapes[key] = shape.Located(TopLoc_Location())
+            parts[uid] = [key, shapeio.locToTuple(shape.Location())]
+        wps = {}
+        for uid, wp in self._wpDict.items():
+            key = 'w%i' % uid
+            wps[uid] = session.wpToIndex(wp, key)
+            if wp.edgeList:
+                shapes[key] = session.edgesToCompound(wp.edgeList)
+            if wp.face is not None:
+                shapes[wps[uid]['face']] = wp.face
+        index = {'currentUID': self._currentUID,
+                 'wpNmbr': self._wpNmbr,
+                 'units': self.units,
+                 'tree': asyPrtTree,
+                 'drawList': list(self.drawList),
+                 'active': [self.activePartUID, self.activeWpUID, self.activeAsyUID],
+                 'parts': parts,
+                 'wps': wps,
+                 'assys': {uid: shapeio.locToTuple(loc)
+                           for uid, loc in self._assyDict.items()},
+                 'names': dict(self._nameDict),
+                 'colors': {uid: shapeio.colorToTuple(color)
+                            for uid, color in self._colorDict.items()},
+                 'transparency': dict(self._transparencyDict),
+                 'ancestors': dict(self._ancestorDict),
+                 'prototypes': dict(self._prototypeDict)}
+        return index, shapes
+
+    def openSession(self):
+        """Replace the session with one loaded from a native session file.
+
+        The file is memory-mapped. Only the shapes of the parts in the
+        drawList are read right away, the others when first needed.
+        Shapes of parts which aren't drawn are released again by redraw
+        (see releaseHiddenParts)."""
+        prompt = 'Select session file to open'
+        fnametuple = QFileDialog.getOpenFileName(None, prompt, './',
+                                                 "cadViewer sessions (*%s)"
+                                                 % session.SUFFIX)
+        fname, _ = fnametuple
+        if not fname:
+            print("Open session cancelled")
+            return
+        try:
+            archive = session.SessionArchive(fname)
+        except (OSError, ValueError) as e:
+            logger.error("Unable to open %s: %s", fname, e)
+            self.statusBar().showMessage("Unable to open %s: %s" % (fname, e), 10000)
+            return
+        self.clearSession()
+        self.restoreSession(archive)
+        self.statusBar().showMessage("Opened %s" % os.path.basename(fname), 5000)
+
+    def clearSession(self):
+        """Remove all parts, assemblies and workplanes from the session."""
+        if self.assyModel is not None:
+            self.assyModel.clear()
+            self.addTreeRoot()
+        else:
+            self.treeViewRoot.takeChildren()
+            self._itemDict = {0: self.treeViewRoot}
+        self._activeItems = {}
+        self._changedItems = []
+        self.removeAllPresentations()
+        self.itemClicked = None
+        self.uidClicked = None
+        self._currentUID = 0
+        self.drawList.clear()
+        self.activePart = None
+        self.activePartUID = 0
+        self.registry.clear()  # parts, names, colors ... assys
+        self._instanceDict = {}
+        self.history.clear()
+        self.activeWp = None
+        self.activeWpUID = 0
+        self._wpNmbr = 1
+        self.activeAsy = self.treeViewRoot
+        self.activeAsyUID = 0
+        self._assyDict[0] = None
+        self.showItemActive(0)
+        self.doc = None
+        if self.sessionArchive is not None:
+            self.sessionArchive.close()
+            self.sessionArchive = None
+
+    def restoreSession(self, archive):
+        """Restore the (cleared) session from archive (session.SessionArchive)."""
+        index = archive.index
+        def byUID(d):  # JSON object keys are strings
+            return {int(k): v for k, v in d.items()}
+        self._currentUID = index['currentUID']
+        self._wpNmbr = index['wpNmbr']
+        self.setUnits(index['units'])
+        self._nameDict.update(byUID(index['names']))
+        self._colorDict.update((uid, shapeio.colorFromTuple(color))
+                               for uid, color in byUID(index['colors']).items())
+        self._transparencyDict.update(byUID(index['transparency']))
+        self._ancestorDict.update(byUID(index['ancestors']))
+        self._prototypeDict.update(byUID(index['prototypes']))
+        for uid, protoUID in self._prototypeDict.items():
+            self._instanceDict.setdefault(protoUID, []).append(uid)
+        self._assyDict.update((uid, shapeio.locFromTuple(loc))
+                              for uid, loc in byUID(index['assys']).items())
+        parts = byUID(index['parts'])
+        archive.prefetch(parts[uid][0] for uid in index['drawList'] if uid in parts)
+        for uid, (key, loc) in parts.items():
+            self._partDict[uid] = session.ArchiveShape(archive, key,
+                                                       shapeio.locFromTuple(loc))
+        for uid, wpIndex in byUID(index['wps']).items():
+            self._wpDict[uid] = session.wpFromIndex(wpIndex, archive)
+        for uid, parentUid, name in index['tree']:
+            self.registry.setParent(uid, parentUid)
+        self.drawList.replace(index['drawList'])  # once all are registered
+        self.sessionArchive = archive
+        if self.assyModel is not None:
+            for uid, parentUid, name in index['tree']:
+                self.assyModel.addNode(uid, parentUid, name,
+                                       assy=uid in self._assyDict)
+        else:
+            items = self._itemDict
+            for uid, parentUid, name in index['tree']:
+                item = QTreeWidgetItem(items[parentUid], [name, str(uid)])
+                if uid in self._assyDict:
+                    item.setFlags(item.flags() | Qt.ItemIsTristate | Qt.ItemIsUserCheckable)
+                    self.treeView.expandItem(item)
+                else:
+                    item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                items[uid] = item
+        self.syncCheckedToDrawList()
+        activePartUID, activeWpUID, activeAsyUID = index['active']
+        if activePartUID in self._partDict:
+            self.setActivePart(activePartUID)
+        if activeWpUID in self._wpDict:
+            self.setActiveWp(activeWpUID)
+        if activeAsyUID in self._assyDict and activeAsyUID:
+            self.setActiveAsy(activeAsyUID)
+        self.meshParts(self.drawList)
+        self.redraw()
 
     #############################################
     #
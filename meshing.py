@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+
+"""Tessellate part shapes ahead of display, in parallel.
+
+AIS_Shape tessellates a shape when it is first displayed, unless the
+shape already has a triangulation fine enough for its drawer. It does so
+one part at a time, on the GUI thread. meshShapes tessellates the parts
+beforehand, to the deflection the drawer would use, so that displaying
+them only uploads their triangulations.
+
+The deflection AIS uses depends on the size of each shape (the default
+drawer deflection is relative). Shapes are grouped by deflection, each
+group in one compound, which BRepMesh_IncrementalMesh meshes in parallel
+(OCCT's own thread pool works over all the faces of the compound).
+Python threads wouldn't help: OCC calls don't release the GIL.
+"""
+
+import logging
+import math
+from OCC.Core.BRep import BRep_Builder, BRep_Tool
+from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
+from OCC.Core.Prs3d import Prs3d_Drawer
+from OCC.Core.StdPrs import StdPrs_ToolTriangulatedShape_GetDeflection
+from OCC.Core.TopAbs import TopAbs_FACE
+from OCC.Core.TopExp import TopExp_Explorer
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.TopoDS import TopoDS_Compound, topods_Face
+
+logger = logging.getLogger(__name__)
+
+STEPS_PER_OCTAVE = 4  # deflections are grouped in steps of 2**(1/4)
+
+
+def displayDeflection(shape, drawer):
+    """Return (linear, angular) deflection used to display shape with drawer.
+
+    GetDeflection stores the deflection it computes in the drawer it is
+    given, so it is given a fresh drawer linked to drawer instead."""
+    linked = Prs3d_Drawer()
+    linked.SetLink(drawer)
+    return (StdPrs_ToolTriangulatedShape_GetDeflection(shape, linked),
+            linked.DeviationAngle())
+
+def groupKey(deflection):
+    """Return deflection rounded down to a step (never coarser)."""
+    step = math.floor(math.log2(deflection) * STEPS_PER_OCTAVE)
+    return 2. ** (step / STEPS_PER_OCTAVE)
+
+def meshShapes(shapes, drawer, parallel=True):
+    """Tessellate shapes as displaying them with drawer would.
+
+    Shapes already tessellated finely enough are left as they are.
+    Return the number of meshing runs (groups of shapes)."""
+    groups = {}  # k = linear deflection, v = list of shapes
+    angle = drawer.DeviationAngle()
+    for shape in shapes:
+        if shape is None or shape.IsNull():
+            continue
+        deflection, _ = displayDeflection(shape, drawer)
+        if deflection > 0.:
+            groups.setdefault(groupKey(deflection), []).append(shape)
+    builder = BRep_Builder()
+    for deflection, group in groups.items():
+        compound = TopoDS_Compound()
+        builder.MakeCompound(compound)
+        for shape in group:
+            builder.Add(compound, shape)
+        BRepMesh_IncrementalMesh(compound, deflection, False, angle, parallel)
+        logger.debug("Meshed %i shapes at deflection %g", len(group), deflection)
+    return len(groups)
+
+def triangleCount(shape):
+    """Return number of triangles of the triangulation of shape's faces."""
+    n = 0
+    explorer = TopExp_Explorer(shape, TopAbs_FACE)
+    while explorer.More():
+        loc = TopLoc_Location()
+        triangulation = BRep_Tool.Triangulation(topods_Face(explorer.Current()), loc)
+        if triangulation is not None and not triangulation.IsNull():
+            n += triangulation.NbTriangles()
+        explorer.Next()
+    return n
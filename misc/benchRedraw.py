@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+
+"""Time displaying N parts with immediate vs batched viewer updates.
+
+Parts are displayed the way MainWindow.displayPart does it (Display,
+SetColor, SetTransparency, HilightWithColor), in an offscreen viewer:
+  immediate: each call updates the viewer (batchedRedraw off)
+  batched: no call updates the viewer, which is updated once at the end
+Then all parts are recolored (attribute updates only), both ways.
+
+usage: python benchRedraw.py [--parts 500]
+"""
+
+import argparse
+import os.path
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from OCC.Core.AIS import AIS_Shape
+from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeBox
+from OCC.Core.gp import gp_Pnt
+from OCC.Core.Quantity import Quantity_Color, Quantity_TOC_RGB
+from myDisplay.OCCViewer import Viewer3d
+
+
+def makeParts(n):
+    """Return list of n boxes, in a square grid."""
+    side = int(n ** 0.5) + 1
+    return [BRepPrimAPI_MakeBox(gp_Pnt(2 * (i % side), 2 * (i // side), 0),
+                                1, 1, 1).Shape()
+            for i in range(n)]
+
+def display(context, shapes, update):
+    """Display shapes as MainWindow.displayPart does. Return AIS_Shapes."""
+    color = Quantity_Color(0.6, 0.6, 0.8, Quantity_TOC_RGB)
+    aisShapes = []
+    for shape in shapes:
+        aisShape = AIS_Shape(shape)
+        context.Display(aisShape, update)
+        context.SetColor(aisShape, color, update)
+        context.SetTransparency(aisShape, 0.0, update)
+        drawer = aisShape.DynamicHilightAttributes()
+        context.HilightWithColor(aisShape, drawer, update)
+        aisShapes.append(aisShape)
+    if not update:
+        context.UpdateCurrentViewer()
+    return aisShapes
+
+def recolor(context, aisShapes, update):
+    color = Quantity_Color(0.8, 0.2, 0.2, Quantity_TOC_RGB)
+    for aisShape in aisShapes:
+        context.SetColor(aisShape, color, update)
+    if not update:
+        context.UpdateCurrentViewer()
+
+def timed(func, *args):
+    """Return (result of func(*args), seconds)."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--parts', type=int, default=500)
+    args = parser.parse_args()
+    viewer = Viewer3d(None)
+    viewer.Create()  # offscreen, as there is no window
+    viewer.SetModeShaded()
+    context = viewer.Context
+    shapes = makeParts(args.parts)
+    results = {}
+    for mode, update in (('immediate', True), ('batched', False)):
+        context.RemoveAll(True)
+        aisShapes, displaySecs = timed(display, context, shapes, update)
+        viewer.FitAll()
+        _, recolorSecs = timed(recolor, context, aisShapes, update)
+        results[mode] = (displaySecs, recolorSecs)
+        print("%-9s  parts %6i  display %8.3f s  recolor %8.3f s"
+              % (mode, args.parts, displaySecs, recolorSecs))
+    for i, what in enumerate(('display', 'recolor')):
+        batched = results['batched'][i]
+        print("%s: batched is %.1fx faster"
+              % (what, results['immediate'][i] / batched if batched else 0.))
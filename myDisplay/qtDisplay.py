@@ -90,6 +90,8 @@ class qtViewer3d(qtBaseViewer):
     # is a list of TopoDS_*
     if HAVE_PYQT_SIGNAL:
         sig_topods_selected = QtCore.pyqtSignal(list)
+        # emitted before the view is rotated, panned or zoomed
+        sig_view_changed = QtCore.pyqtSignal()
 
     def __init__(self, *kargs):
         qtBaseViewer.__init__(self, *kargs)
@@ -198,6 +200,8 @@ class qtViewer3d(qtBaseViewer):
             zoom_factor = 2.
         else:
             zoom_factor = 0.5
+        if HAVE_PYQT_SIGNAL:
+            self.sig_view_changed.emit()
         self._display.ZoomFactor(zoom_factor)
 
     @property
@@ -319,12 +323,16 @@ class qtViewer3d(qtBaseViewer):
         if (buttons == QtCore.Qt.MidButton and
             modifiers == QtCore.Qt.ControlModifier):
             self.cursor = "rotate"
+            if HAVE_PYQT_SIGNAL:
+                self.sig_view_changed.emit()
             self._display.Rotation(pt.x(), pt.y())
             self._drawbox = False
         # DYNAMIC ZOOM
         elif (buttons == QtCore.Qt.RightButton and
               modifiers == QtCore.Qt.ControlModifier):
             self.cursor = "zoom"
+            if HAVE_PYQT_SIGNAL:
+                self.sig_view_changed.emit()
             self._display.Repaint()
             self._display.DynamicZoom(abs(self.dragStartPosX),
                                       abs(self.dragStartPosY), abs(pt.x()),
@@ -340,6 +348,8 @@ class qtViewer3d(qtBaseViewer):
             self.dragStartPosX = pt.x()
             self.dragStartPosY = pt.y()
             self.cursor = "pan"
+            if HAVE_PYQT_SIGNAL:
+                self.sig_view_changed.emit()
             self._display.Pan(dx, -dy)
             self._drawbox = False
         # DRAW BOX
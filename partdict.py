@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+from abc import ABC, abstractmethod
+
+
+class DeferredShape(ABC):
+    """Stand-in for a TopoDS_Shape which is only built when first needed.
+
+    Subclasses implement load(), returning the shape."""
+
+    def __init__(self):
+        self._shape = None
+
+    @abstractmethod
+    def load(self):
+        """Return the shape (called on first use)."""
+
+    def shape(self):
+        """Return the shape, loading it on first use."""
+        if self._shape is None:
+            self._shape = self.load()
+        return self._shape
+
+    def isLoaded(self):
+        return self._shape is not None
+
+    def peek(self, func):
+        """Return func(shape), releasing the shape again if loaded for this."""
+        wasLoaded = self.isLoaded()
+        try:
+            return func(self.shape())
+        finally:
+            if not wasLoaded:
+                self.release()
+
+    def location(self):
+        """Return the location of the shape."""
+        if self.isLoaded():
+            return self._shape.Location()
+        return self.peek(lambda shape: shape.Location())
+
+    def source(self):
+        """Return a key shared by stand-ins of the same (unlocated) shape.
+
+        None if the shape isn't shared."""
+        return None
+
+    def release(self):
+        """Forget the loaded shape (it will be loaded again if needed)."""
+        self._shape = None
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+
+"""Registry of the parts, assemblies & workplanes of the session, by uid.
+
+Each uid has a row. The scalar attributes of each row (type, parent,
+ancestor, prototype, color, transparency & visibility) are held in array
+columns, its name and object (shape, location or workplane) in lists.
+This takes far less memory per part than a dict per attribute, and lets
+queries over a whole assembly run in one pass over the columns (see
+descendants, visibleParts).
+
+The views (parts, assys, wps, names, colors, transparency, ancestors &
+prototypes) present the columns as dicts keyed by uid.
+"""
+
+from array import array
+from collections.abc import MutableMapping
+from partdict import DeferredShape
+import shapeio
+
+NO_UID = -1  # in parent, ancestor & prototype columns: none
+UNSET = -1.  # in color & transparency columns: not set
+NONE, PART, ASSY, WP = 0, 1, 2, 3  # row types
+
+
+class PartRegistry():
+    """Columns of the state of parts, assemblies & workplanes."""
+
+    def __init__(self):
+        self.parts = PartView(self, PART)  # v = <TopoDS_Shape> object
+        self.assys = ObjectView(self, ASSY)  # v = <TopLoc_Location> object
+        self.wps = ObjectView(self, WP)  # v = <WorkPlane> object
+        self.names = ColumnView(self, 'name', None)
+        self.colors = ColorView(self)  # v = <Quantity_Color> object
+        self.transparency = ColumnView(self, 'transp', UNSET)
+        self.ancestors = ColumnView(self, 'ancestor', NO_UID)
+        self.prototypes = ColumnView(self, 'proto', NO_UID)
+        self.clear()
+
+    def clear(self):
+        self._rows = {}  # k = uid, v = row
+        self._byType = {PART: {}, ASSY: {}, WP: {}}  # v = {uid: None}, in order
+        self._children = None  # k = uid, v = child uids (rebuilt when needed)
+        self.loaded = set()  # uids of deferred parts loaded (see PartView)
+        self.uid = array('q')
+        self.typ = array('b')
+        self.parent = array('q')
+        self.ancestor = array('q')
+        self.proto = array('q')
+        self.rgb = array('d')  # r, g, b of each row
+        self.transp = array('d')
+        self.visible = array('b')
+        self.name = []
+        self.obj = []
+
+    def __contains__(self, uid):
+        return uid in self._rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def row(self, uid, create=False):
+        """Return row of uid, adding it if create (else KeyError)."""
+        row = self._rows.get(uid)
+        if row is None:
+            if not create:
+                raise KeyError(uid)
+            row = self._rows[uid] = len(self.uid)
+            self.uid.append(uid)
+            self.typ.append(NONE)
+            self.parent.append(NO_UID)
+            self.ancestor.append(NO_UID)
+            self.proto.append(NO_UID)
+            self.rgb.extend((UNSET, UNSET, UNSET))
+            self.transp.append(UNSET)
+            self.visible.append(0)
+            self.name.append(None)
+            self.obj.append(None)
+        return row
+
+    def setObject(self, uid, typ, obj):
+        """Set the type & object of uid."""
+        row = self.row(uid, True)
+        oldTyp = self.typ[row]
+        if oldTyp != typ:
+            if oldTyp != NONE:
+                del self._byType[oldTyp][uid]
+            if typ != NONE:
+                self._byType[typ][uid] = None
+            self.typ[row] = typ
+        self.obj[row] = obj
+
+    def typeOf(self, uid):
+        row = self._rows.get(uid)
+        return NONE if row is None else self.typ[row]
+
+    def uidsOf(self, typ):
+        """Return uids of type (typ), in the order they were added."""
+        return list(self._byType[typ])
+
+    def rgbOf(self, uid):
+        """Return color of uid as (r, g, b) tuple (or None)."""
+        row = self._rows.get(uid)
+        if row is None or self.rgb[3*row] == UNSET:
+            return None
+        return tuple(self.rgb[3*row:3*row+3])
+
+    def transparencyOf(self, uid, default=0.):
+        row = self._rows.get(uid)
+        if row is None or self.transp[row] == UNSET:
+            return default
+        return self.transp[row]
+
+    # Structure
+
+    def setParent(self, uid, parentUid):
+        self.parent[self.row(uid, True)] = parentUid
+        self._children = None
+
+    def parentOf(self, uid):
+        return self.parent[self.row(uid)]
+
+    def children(self, uid):
+        """Return uids of the children of uid."""
+        if self._children is None:
+            self._children = children = {}
+            for child, parent in zip(self.uid, self.parent):
+                if parent != NO_UID:
+                    children.setdefault(parent, []).append(child)
+        return self._children.get(uid, [])
+
+    def descendants(self, uid):
+        """Return uids of all descendants of uid, level by level."""
+        result = []
+        level = [uid]
+        while level:
+            level = [child for parent in level for child in self.children(parent)]
+            result.extend(level)
+        return result
+
+    # Visibility
+
+    def setVisible(self, uids, visible):
+        """Set visibility of uids (those in the registry)."""
+        rows = self._rows
+        for uid in uids:
+            row = rows.get(uid)
+            if row is not None:
+                self.visible[row] = visible
+
+    def isVisible(self, uid):
+        row = self._rows.get(uid)
+        return row is not None and bool(self.visible[row])
+
+    def visibleParts(self, uid=None):
+        """Return uids of the visible parts (below assembly uid, if given)."""
+        if uid is None:
+            return [u for u, typ, visible in zip(self.uid, self.typ, self.visible)
+                    if typ == PART and visible]
+        rows = self._rows
+        return [u for u in self.descendants(uid)
+                if self.typ[rows[u]] == PART and self.visible[rows[u]]]
+
+    def hiddenParts(self):
+        """Return uids of the parts which aren't visible."""
+        return [u for u, typ, visible in zip(self.uid, self.typ, self.visible)
+                if typ == PART and not visible]
+
+
+class ObjectView(MutableMapping):
+    """Objects of the rows of one type, as a dict: k = uid, v = object."""
+
+    def __init__(self, registry, typ):
+        self._registry = registry
+        self._typ = typ
+
+    def __contains__(self, uid):
+        return uid in self._registry._byType[self._typ]
+
+    def __getitem__(self, uid):
+        if uid not in self:
+            raise KeyError(uid)
+        registry = self._registry
+        return registry.obj[registry._rows[uid]]
+
+    def __setitem__(self, uid, obj):
+        self._registry.setObject(uid, self._typ, obj)
+
+    def __delitem__(self, uid):
+        if uid not in self:
+            raise KeyError(uid)
+        self._registry.setObject(uid, NONE, None)
+
+    def __iter__(self):
+        return iter(list(self._registry._byType[self._typ]))
+
+    def __len__(self):
+        return len(self._registry._byType[self._typ])
+
+
+class PartView(ObjectView):
+    """Parts: k = uid, v = <TopoDS_Shape> object
+
+    Values may also be DeferredShape objects. Those are resolved to their
+    shape when looked up, so to the rest of the app they look like any
+    other shape. Membership tests (uid in parts) never load anything.
+    """
+
+    def __getitem__(self, uid):
+        value = ObjectView.__getitem__(self, uid)
+        if isinstance(value, DeferredShape):
+            if not value.isLoaded():
+                self._registry.loaded.add(uid)
+            return value.shape()
+        return value
+
+    def deferred(self, uid):
+        """Return the DeferredShape of part (uid), or None if not deferred."""
+        value = ObjectView.__getitem__(self, uid)
+        if isinstance(value, DeferredShape):
+            return value
+        return None
+
+    def isLoaded(self, uid):
+        """Return False if part (uid) is deferred and not yet loaded."""
+        value = ObjectView.__getitem__(self, uid)
+        if isinstance(value, DeferredShape):
+            return value.isLoaded()
+        return True
+
+    def release(self, uid):
+        """Release the loaded shape of a deferred part (uid), if any."""
+        value = ObjectView.__getitem__(self, uid)
+        if isinstance(value, DeferredShape):
+            value.release()
+        self._registry.loaded.discard(uid)
+
+
+class ColumnView(MutableMapping):
+    """One column, as a dict: k = uid, v = value (rows set to unset left out)"""
+
+    def __init__(self, registry, column, unset):
+        self._registry = registry
+        self._column = column
+        self._unset = unset
+
+    def _values(self):
+        return getattr(self._registry, self._column)
+
+    def __contains__(self, uid):
+        row = self._registry._rows.get(uid)
+        return row is not None and self._values()[row] != self._unset
+
+    def __getitem__(self, uid):
+        row = self._registry._rows.get(uid)
+        if row is None or self._values()[row] == self._unset:
+            raise KeyError(uid)
+        return self._values()[row]
+
+    def __setitem__(self, uid, value):
+        self._values()[self._registry.row(uid, True)] = value
+
+    def __delitem__(self, uid):
+        if uid not in self:
+            raise KeyError(uid)
+        self._values()[self._registry._rows[uid]] = self._unset
+
+    def __iter__(self):
+        unset = self._unset
+        return iter([uid for uid, value in zip(self._registry.uid, self._values())
+                     if value != unset])
+
+    def __len__(self):
+        unset = self._unset
+        return sum(1 for value in self._values() if value != unset)
+
+
+class ColorView(MutableMapping):
+    """Colors, as a dict: k = uid, v = <Quantity_Color> object
+
+    Colors are held as rgb values, so each lookup returns a new
+    Quantity_Color. Changing it in place doesn't change the part's color
+    (assign it back instead), and lookups never compare identical (is)."""
+
+    def __init__(self, registry):
+        self._registry = registry
+
+    def __contains__(self, uid):
+        return self._registry.rgbOf(uid) is not None
+
+    def __getitem__(self, uid):
+        rgb = self._registry.rgbOf(uid)
+        if rgb is None:
+            raise KeyError(uid)
+        return shapeio.colorFromTuple(rgb)
+
+    def __setitem__(self, uid, color):
+        registry = self._registry
+        row = registry.row(uid, True)
+        registry.rgb[3*row:3*row+3] = array('d', shapeio.colorToTuple(color)
+                                            or (UNSET, UNSET, UNSET))
+
+    def __delitem__(self, uid):
+        if uid not in self:
+            raise KeyError(uid)
+        self[uid] = None
+
+    def __iter__(self):
+        rgb = self._registry.rgb
+        return iter([uid for row, uid in enumerate(self._registry.uid)
+                     if rgb[3*row] != UNSET])
+
+    def __len__(self):
+        return sum(1 for r in self._registry.rgb[::3] if r != UNSET)
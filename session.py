@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+"""Native session files: an index plus shapes, in one random-access file.
+
+The index holds everything but the shapes: the registry dictionaries,
+the tree structure, workplanes (their 2D construction geometry), the
+drawList and the active part/wp/assembly. It is built and restored by
+MainWindow (see sessionIndex). Each shape is stored once, not located,
+as zlib compressed BRep. Instances of the same prototype share one shape.
+
+File layout:
+    MAGIC
+    shape blobs, one after the other
+    index (JSON), including its table of contents 'toc':
+        {shape key: [offset, length]}
+    trailer: offset and length of the index, MAGIC
+
+The file is memory-mapped when opened, so opening it costs only reading
+the index, however large the file is. A shape is read (deserialized)
+when it is first needed.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from OCC.Core.BRep import BRep_Builder
+from OCC.Core.gp import gp_Ax3, gp_Dir, gp_Pnt
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.TopoDS import TopoDS_Compound, TopoDS_Iterator, topods_Edge, topods_Face
+import shapeio
+from partdict import DeferredShape
+import workplane
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+SUFFIX = '.cvz'
+MAGIC = b'CADVIEWR'
+TRAILER = struct.Struct('<QQ8s')  # index offset, index length, MAGIC
+BATCH_SIZE = 64  # shapes serialized between writes
+
+
+def writeSession(fname, index, shapes, workers=None):
+    """Write session file fname.
+
+    index is a JSON serializable dict. shapes is a dict {key: shape},
+    where shape is a TopoDS_Shape (not located) or an ArchiveShape, whose
+    compressed blob is then copied as is, without being deserialized.
+    Other DeferredShapes are loaded only to be serialized (without their
+    location), then released again.
+    The shapes are serialized one after the other (OCC holds the GIL), but
+    compressed concurrently, in batches. The file is written under a
+    temporary name, then renamed, so an existing file is never left half
+    written."""
+    keys = list(shapes)
+    toc = {}  # k = shape key, v = [offset, length]
+    tmpFname = fname + '.tmp'
+    with open(tmpFname, 'wb') as f, ThreadPoolExecutor(workers) as executor:
+        f.write(MAGIC)
+        for start in range(0, len(keys), BATCH_SIZE):
+            batch = keys[start:start+BATCH_SIZE]
+            blobs = []
+            for key in batch:
+                shape = shapes[key]
+                if isinstance(shape, ArchiveShape):
+                    blobs.append(executor.submit(shape.archive.blob, shape.key))
+                else:  # zlib releases the GIL
+                    if isinstance(shape, DeferredShape):
+                        data = shape.peek(unlocatedBytes)
+                    else:
+                        data = shapeio.shapeToBytes(shape)
+                    blobs.append(executor.submit(zlib.compress, data))
+            for key, blob in zip(batch, blobs):
+                blob = blob.result()
+                toc[key] = [f.tell(), len(blob)]
+                f.write(blob)
+        indexOffset = f.tell()
+        data = json.dumps(dict(index, version=FORMAT_VERSION, toc=toc),
+                          separators=(',', ':')).encode()
+        f.write(data)
+        f.write(TRAILER.pack(indexOffset, len(data), MAGIC))
+    os.replace(tmpFname, fname)
+
+
+class SessionArchive():
+    """Session file open for reading (memory-mapped).
+
+    Part shapes are acquired from the archive when needed (see
+    ArchiveShape) and released when no longer needed, so that only the
+    shapes in use are held in memory. The shapes of instances of the same
+    prototype share one TShape."""
+
+    def __init__(self, fname):
+        self.fname = fname
+        with open(fname, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if (len(self._mm) < len(MAGIC) + TRAILER.size
+                    or self._mm[:len(MAGIC)] != MAGIC):
+                raise ValueError("%s is not a session file" % fname)
+            offset, length, magic = TRAILER.unpack(self._mm[-TRAILER.size:])
+            if magic != MAGIC:
+                raise ValueError("%s is truncated" % fname)
+            self.index = json.loads(self._mm[offset:offset+length].decode())
+            if self.index.get('version') != FORMAT_VERSION:
+                raise ValueError("%s: unsupported session format version %s"
+                                 % (fname, self.index.get('version')))
+        except Exception:
+            self._mm.close()
+            raise
+        self.toc = self.index.pop('toc')
+        self._shapes = {}  # k = shape key, v = [TopoDS_Shape, number of users]
+
+    def blob(self, key):
+        """Return the compressed BRep of the shape stored under key."""
+        offset, length = self.toc[key]
+        return self._mm[offset:offset+length]
+
+    def readShape(self, key):
+        """Return (a new copy of) the shape stored under key."""
+        return shapeio.shapeFromBytes(zlib.decompress(self.blob(key)))
+
+    def acquire(self, key):
+        """Return the shape stored under key, reading it if not in use."""
+        entry = self._shapes.get(key)
+        if entry is None:
+            entry = self._shapes[key] = [self.readShape(key), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def release(self, key):
+        """Release the shape stored under key (see acquire)."""
+        entry = self._shapes[key]
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self._shapes[key]
+
+    def prefetch(self, keys, workers=None):
+        """Read the shapes stored under keys, decompressing concurrently.
+
+        They are held until acquired and released."""
+        keys = [key for key in set(keys) if key not in self._shapes]
+        with ThreadPoolExecutor(workers) as executor:
+            blobs = executor.map(zlib.decompress, [self.blob(key) for key in keys])
+            for key, data in zip(keys, blobs):
+                self._shapes[key] = [shapeio.shapeFromBytes(data), 0]
+
+    def residentShapes(self):
+        """Return number of shapes held in memory."""
+        return len(self._shapes)
+
+    def close(self):
+        self._shapes = {}
+        self._mm.close()
+
+
+class ArchiveShape(DeferredShape):
+    """Part shape acquired from a SessionArchive when first needed."""
+
+    def __init__(self, archive, key, loc=None):
+        DeferredShape.__init__(self)
+        self.archive = archive
+        self.key = key
+        self.loc = loc  # TopLoc_Location
+
+    def load(self):
+        shape = self.archive.acquire(self.key)
+        if self.loc is not None:
+            shape = shape.Located(self.loc)
+        return shape
+
+    def location(self):
+        """Return the location of the part, without loading it."""
+        if self.isLoaded():
+            return self._shape.Location()
+        return self.loc
+
+    def source(self):
+        return (id(self.archive), self.key)
+
+    def release(self):
+        if self.isLoaded():
+            # The part may have been moved in place (shape.Move)
+            self.loc = self._shape.Location()
+            DeferredShape.release(self)
+            self.archive.release(self.key)
+
+
+def unlocatedBytes(shape):
+    return shapeio.shapeToBytes(shape.Located(TopLoc_Location()))
+
+def wpToIndex(wp, key):
+    """Return JSON serializable dict of workplane wp.
+
+    The profile edges of wp are not included: they are stored (as one
+    compound) under shape key, for the caller to write. So is the face
+    wp was made on (if any), under the shape key returned as 'face'."""
+    return {'size': wp.size,
+            'origin': [wp.origin.X(), wp.origin.Y(), wp.origin.Z()],
+            'wDir': [wp.wDir.X(), wp.wDir.Y(), wp.wDir.Z()],
+            'uDir': [wp.uDir.X(), wp.uDir.Y(), wp.uDir.Z()],
+            'clines': sorted(wp.clines),
+            'ccircs': sorted(wp.ccircs),
+            'edges': key if wp.edgeList else None,
+            'wire': wp.wire is not None,
+            'face': key + 'f' if wp.face is not None else None}
+
+def edgesToCompound(edges):
+    compound = TopoDS_Compound()
+    builder = BRep_Builder()
+    builder.MakeCompound(compound)
+    for edge in edges:
+        builder.Add(compound, edge)
+    return compound
+
+def wpFromIndex(d, archive):
+    """Return WorkPlane rebuilt from dict d (see wpToIndex)."""
+    ax3 = gp_Ax3(gp_Pnt(*d['origin']), gp_Dir(*d['wDir']), gp_Dir(*d['uDir']))
+    wp = workplane.WorkPlane(d['size'], ax3=ax3)
+    wp.clines = {tuple(cline) for cline in d['clines']}
+    wp.ccircs = {(tuple(cntr), rad) for cntr, rad in d['ccircs']}
+    if d['edges']:
+        it = TopoDS_Iterator(archive.readShape(d['edges']))
+        while it.More():
+            wp.edgeList.append(topods_Edge(it.Value()))
+            it.Next()
+    if d['wire']:
+        wp.makeWire()
+    if d.get('face'):  # a copy: it no longer shares the part's TShape
+        wp.face = topods_Face(archive.readShape(d['face']))
+    return wp
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+"""Convert OCC objects to and from plain (picklable) python data.
+
+Shapes are converted to BRep bytes, locations to the 12 coefficients
+of their gp_Trsf and colors to (r, g, b) tuples. This is what lets
+shapes cross a process boundary or be written to disk.
+"""
+
+import os
+import tempfile
+from OCC.Core.BRep import BRep_Builder
+from OCC.Core.BRepTools import breptools_Read, breptools_Write
+from OCC.Core.gp import gp_Trsf
+from OCC.Core.Quantity import Quantity_Color, Quantity_TOC_RGB
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.TopoDS import TopoDS_Shape
+
+
+def shapeToBytes(shape):
+    """Return BRep representation of shape (TopoDS_Shape) as bytes."""
+    fd, path = tempfile.mkstemp(suffix='.brep')
+    os.close(fd)
+    try:
+        breptools_Write(shape, path)
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+def shapeFromBytes(data):
+    """Return TopoDS_Shape rebuilt from BRep bytes."""
+    fd, path = tempfile.mkstemp(suffix='.brep')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        shape = TopoDS_Shape()
+        breptools_Read(shape, path, BRep_Builder())
+        return shape
+    finally:
+        os.remove(path)
+
+def locToTuple(loc):
+    """Return TopLoc_Location as tuple of 12 gp_Trsf coefficients.
+
+    Return None if loc is None."""
+    if loc is None:
+        return None
+    trsf = loc.Transformation()
+    return tuple(trsf.Value(i, j) for i in range(1, 4) for j in range(1, 5))
+
+def locFromTuple(values):
+    """Return TopLoc_Location from tuple of 12 gp_Trsf coefficients."""
+    if values is None:
+        return None
+    trsf = gp_Trsf()
+    trsf.SetValues(*values)
+    return TopLoc_Location(trsf)
+
+def colorToTuple(color):
+    """Return Quantity_Color as (r, g, b) tuple (or None)."""
+    if color is None:
+        return None
+    return (color.Red(), color.Green(), color.Blue())
+
+def colorFromTuple(rgb):
+    """Return Quantity_Color from (r, g, b) tuple (or None)."""
+    if rgb is None:
+        return None
+    r, g, b = rgb
+    return Quantity_Color(r, g, b, Quantity_TOC_RGB)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+import hashlib
+import json
+import logging
+import os
+import os.path
+import struct
+import tempfile
+import zlib
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cadviewer', 'stepcache')
+DEFAULT_MAX_SIZE = 2 * 1024**3  # bytes
+MAGIC = b'CVSTEPC1'
+HEADER = struct.Struct('<8sQ')  # MAGIC, length of the JSON part
+BYTES = '$bytes'  # key of a reference to bytes appended after the JSON
+
+
+def encodeRecords(records):
+    """Return records (see stepXD.treeToRecords) as bytes.
+
+    They are written as JSON, except for bytes values (BReps), which are
+    appended after it and referred to as {BYTES: [offset, length]}.
+    Unlike unpickling, decoding this can't run any code."""
+    blobs = []
+    offset = 0
+    def encode(value):
+        nonlocal offset
+        if isinstance(value, bytes):
+            blobs.append(value)
+            ref = {BYTES: [offset, len(value)]}
+            offset += len(value)
+            return ref
+        if isinstance(value, dict):
+            return {k: encode(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [encode(v) for v in value]
+        return value
+    header = json.dumps(encode(records), separators=(',', ':')).encode()
+    return b''.join([HEADER.pack(MAGIC, len(header)), header] + blobs)
+
+def decodeRecords(data):
+    """Return records from bytes made by encodeRecords (else ValueError)."""
+    if len(data) < HEADER.size:
+        raise ValueError("truncated entry")
+    magic, length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a STEP cache entry")
+    start = HEADER.size + length
+    def decode(value):
+        if isinstance(value, dict):
+            if BYTES in value:
+                offset, size = value[BYTES]
+                return data[start+offset:start+offset+size]
+            return {k: decode(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [decode(v) for v in value]
+        return value
+    return [tuple(decode(record))
+            for record in json.loads(data[HEADER.size:start].decode())]
+
+
+class StepCache():
+    """On-disk cache of imported STEP files.
+
+    Each entry holds the tree records (see stepXD.treeToRecords) of one
+    imported file: per-part BRep plus the name, uid (relative to the first
+    uid of the import), color and location of every node. Entries are keyed
+    by a hash of the file contents and the reader options, so a file which
+    has been edited (or read with different options) is never served stale.
+    When the total size of the cache exceeds maxSize, the least recently
+    used entries are evicted.
+    """
+
+    suffix = '.cache'
+
+    def __init__(self, cacheDir=DEFAULT_CACHE_DIR, maxSize=DEFAULT_MAX_SIZE):
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def key(self, filename, options):
+        """Return cache key of filename as read with (dict) options."""
+        sha = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024*1024), b''):
+                sha.update(chunk)
+        sha.update(repr(sorted(options.items())).encode())
+        return sha.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cacheDir, key + self.suffix)
+
+    def get(self, key):
+        """Return records stored under key, or None if not cached."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                records = decodeRecords(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error, ValueError) as e:
+            logger.error("Discarding unreadable cache entry %s: %s", path, e)
+            self.discard(key)
+            return None
+        try:
+            os.utime(path)  # mark as most recently used
+        except FileNotFoundError:  # evicted meanwhile (by another process)
+            pass
+        logger.info("STEP cache hit: %s", key)
+        return records
+
+    def put(self, key, records):
+        """Store records under key, then evict entries to fit maxSize."""
+        path = self.path(key)
+        # A unique name, as other processes may be storing the same key
+        fd, tmpPath = tempfile.mkstemp(suffix='.tmp', dir=self.cacheDir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(zlib.compress(encodeRecords(records)))
+            os.replace(tmpPath, path)
+        except BaseException:
+            os.remove(tmpPath)
+            raise
+        logger.info("STEP cache store: %s", key)
+        self.evict()
+
+    def discard(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        """Return list of (mtime, size, path) of cache entries, oldest first."""
+        entries = []
+        for entry in os.scandir(self.cacheDir):
+            if entry.name.endswith(self.suffix):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # evicted by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def size(self):
+        """Return total size (bytes) of cache entries."""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove least recently used entries until total size <= maxSize."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.maxSize:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:  # evicted by another process
+                pass
+            else:
+                logger.info("STEP cache evict: %s", path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+import logging
+import multiprocessing
+import os
+import os.path
+import queue
+from OCC.Core.IFSelect import IFSelect_RetDone
+from OCC.Core.Interface import Interface_Static_SetCVal
+from OCC.Core.STEPCAFControl import STEPCAFControl_Writer
+from OCC.Core.STEPControl import STEPControl_Writer, STEPControl_AsIs
+from OCC.Core.TCollection import TCollection_ExtendedString
+from OCC.Core.TDataStd import TDataStd_Name
+from OCC.Core.TopLoc import TopLoc_Location
+from OCC.Core.XCAFDoc import XCAFDoc_ColorSurf
+from partdict import DeferredShape
+import shapeio
+import stepXD
+from treemodel import TreeModel
+
+logger = logging.getLogger(__name__)
+
+
+class ExportJob():
+    """STEP export running in a separate process.
+
+    The job works on a snapshot (picklable, see snapshotShape and
+    stepXD.treeToRecords) taken when it is created, so the user can keep
+    on working while it runs. The worker reports its progress as messages,
+    which the caller collects by polling. Each message is a tuple:
+    ('progress', text), ('done', fname) or ('error', text).
+    The file is written under a temporary name and only renamed to fname
+    once complete, so a failed or cancelled job never leaves a partial file.
+    """
+
+    def __init__(self, fname, writer, snapshot):
+        self.fname = fname
+        self.status = 'running'  # running | done | failed | cancelled
+        # 'spawn' keeps Qt state out of the worker process
+        context = multiprocessing.get_context('spawn')
+        self._queue = context.Queue()
+        self._process = context.Process(target=runExport,
+                                        args=(writer, snapshot, fname, self._queue),
+                                        daemon=True)
+        self._process.start()
+
+    def isRunning(self):
+        return self.status == 'running'
+
+    def poll(self):
+        """Return list of messages received since last poll."""
+        messages = []
+        while True:
+            try:
+                messages.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for kind, text in messages:
+            if kind == 'done':
+                self.status = 'done'
+            elif kind == 'error':
+                self.status = 'failed'
+        if self.isRunning() and not self._process.is_alive():
+            # Died without a word (e.g. a crash in OCC)
+            self.status = 'failed'
+            messages.append(('error', "Export process exited with code %s"
+                             % self._process.exitcode))
+        if not self.isRunning():
+            self._process.join()
+        return messages
+
+    def cancel(self):
+        if not self.isRunning():
+            return
+        self._process.terminate()
+        self._process.join()
+        self.status = 'cancelled'
+        discard(tmpName(self.fname))
+
+
+def tmpName(fname):
+    return fname + '.part'
+
+def discard(fname):
+    try:
+        os.remove(fname)
+    except FileNotFoundError:
+        pass
+
+def snapshotShape(shape, name):
+    """Return snapshot of a single shape, for writer 'shape'."""
+    return {'name': name, 's': shapeio.shapeToBytes(shape)}
+
+def runExport(writer, snapshot, fname, messages):
+    """Write snapshot to STEP file fname, posting progress to messages.
+
+    Run in the worker process of an ExportJob. writer is the name of one
+    of the functions in WRITERS."""
+    export(lambda f: WRITERS[writer](snapshot, f, messages), fname, messages)
+
+def export(write, fname, messages):
+    """Call write(tmpFname) then rename the file written to fname.
+
+    Post the outcome to messages. Return True if successful."""
+    tmpFname = tmpName(fname)
+    try:
+        status = write(tmpFname)
+        if status != IFSelect_RetDone:
+            raise RuntimeError("STEP writer returned status %s" % status)
+        os.replace(tmpFname, fname)
+    except Exception as e:
+        discard(tmpFname)
+        messages.put(('error', "Unable to save %s: %s" % (fname, e)))
+        return False
+    messages.put(('done', fname))
+    return True
+
+def writeShape(snapshot, fname, messages):
+    """Write a single shape (see snapshotShape) as AP203."""
+    messages.put(('progress', "Transferring %s" % snapshot['name']))
+    shape = shapeio.shapeFromBytes(snapshot['s'])
+    step_writer = STEPControl_Writer()
+    Interface_Static_SetCVal("write.step.schema", "AP203")
+    step_writer.Transfer(shape, STEPControl_AsIs)
+    messages.put(('progress', "Writing"))
+    return step_writer.Write(fname)
+
+def writeRecords(records, fname, messages):
+    """Write tree records (see stepXD.treeToRecords) as an XCAF assembly."""
+    messages.put(('progress', "Building document"))
+    sessionDoc = SessionDoc()
+    sessionDoc.addTree(stepXD.recordsToTree(records))
+    return sessionDoc.write(fname, messages)
+
+WRITERS = {'shape': writeShape, 'records': writeRecords}
+
+def setName(label, name):
+    TDataStd_Name.Set(label, TCollection_ExtendedString(name))
+
+def unlocatedBytes(shape):
+    return shapeio.shapeToBytes(shape.Located(TopLoc_Location()))
+
+def sameShape(sent, shape):
+    """Return True if part shape is unchanged since it was sent.
+
+    Deferred shapes are held as (DeferredShape, location tuple)."""
+    if isinstance(sent, tuple) or isinstance(shape, tuple):
+        return sent == shape
+    return sent.IsEqual(shape)
+
+def shapeKey(uid, data):
+    """Return key of the shape referred to by part (uid, data).
+
+    Instances of the same prototype (data['p']) share one key."""
+    if 'p' in data:
+        return 'p%i' % data['p']
+    return 'u%i' % uid
+
+
+class SessionDoc():
+    """XCAF document of a tree, which can be updated part by part.
+
+    The tree is in the format built by stepXD.StepImporter (its root is an
+    assembly): assembly nodes carry their location relative to their
+    parent, part shapes are located in the coordinates of the top assembly.
+    Parts with the same shape key (see shapeKey) become components
+    referring to a single shape.
+    """
+
+    def __init__(self):
+        self.tmodel = TreeModel("STEP")
+        self.shape_tool = self.tmodel.shape_tool
+        self.color_tool = self.tmodel.color_tool
+        self.assyLabels = {}   # k = assy uid, v = label
+        self.assyLocs = {}     # k = assy uid, v = location in top assy coords
+        self.partLabels = {}   # k = part uid, v = (component label, shape key)
+        self.shapeLabels = {}  # k = shape key, v = [label, number of parts using it]
+
+    def addTree(self, tree):
+        if tree.root is None:
+            return
+        for uid in tree.expand_tree(mode=tree.DEPTH, sorting=False):
+            node = tree.get_node(uid)
+            data = node.data
+            if data['a']:
+                self.addAssy(uid, node.bpointer, node.tag, data['l'])
+            elif data['s'] is not None:
+                shape = data['s']
+                self.addPart(uid, node.bpointer, node.tag, data['c'],
+                             shapeKey(uid, data), shape.Location(),
+                             shape.Located(TopLoc_Location()))
+
+    def addAssy(self, uid, parentUid, name, loc):
+        label = self.shape_tool.NewShape()
+        setName(label, name)
+        loc = loc or TopLoc_Location()
+        parentLoc = TopLoc_Location()
+        if parentUid is not None:
+            comp = self.shape_tool.AddComponent(self.assyLabels[parentUid], label, loc)
+            setName(comp, name)
+            parentLoc = self.assyLocs[parentUid]
+        self.assyLabels[uid] = label
+        self.assyLocs[uid] = parentLoc.Multiplied(loc)
+
+    def addPart(self, uid, parentUid, name, color, key, loc, shape=None):
+        """Add part (uid) to assembly (parentUid), located at loc.
+
+        shape (not located) is needed only if no shape is held under key."""
+        entry = self.shapeLabels.get(key)
+        if entry is None:
+            refLabel = self.shape_tool.AddShape(shape, False)
+            setName(refLabel, name)
+            entry = self.shapeLabels[key] = [refLabel, 0]
+        entry[1] += 1
+        relLoc = self.assyLocs[parentUid].Inverted().Multiplied(loc)
+        comp = self.shape_tool.AddComponent(self.assyLabels[parentUid], entry[0], relLoc)
+        setName(comp, name)
+        if color:  # on the component, as parts sharing a shape may differ
+            self.color_tool.SetColor(comp, color, XCAFDoc_ColorSurf)
+        self.partLabels[uid] = (comp, key)
+
+    def removePart(self, uid):
+        """Remove part (uid), and its shape if no other part refers to it."""
+        comp, key = self.partLabels.pop(uid)
+        self.shape_tool.RemoveComponent(comp)
+        entry = self.shapeLabels[key]
+        entry[1] -= 1
+        if not entry[1]:
+            self.shape_tool.RemoveShape(entry[0])
+            del self.shapeLabels[key]
+
+    def write(self, fname, messages):
+        """Transfer doc and write it to STEP file fname. Return status.
+
+        The whole document is transferred and written each time."""
+        self.shape_tool.UpdateAssemblies()
+        messages.put(('progress', "Transferring all %i parts" % len(self.partLabels)))
+        step_writer = STEPCAFControl_Writer()
+        step_writer.Transfer(self.tmodel.doc)
+        messages.put(('progress', "Writing"))
+        return step_writer.Write(fname)
+
+
+class IncrementalExport():
+    """Repeated STEP exports of a tree, rebuilding only what changed.
+
+    A worker process keeps the SessionDoc of the last export. Each export
+    after the first compares the tree with the one sent last time and
+    sends only the parts which were added, removed or changed (shape,
+    location, name, color, parent or shape key). Only those parts are
+    serialized and updated in the SessionDoc. If an assembly changed, the
+    whole tree is sent again. After a failure or cancellation, the next
+    export also sends everything.
+    Only the serialization and document update are proportional to the
+    change: the STEP file itself is still transferred and written in full
+    (see SessionDoc.write), as the STEP writer can't update a file.
+    The interface (fname, status, isRunning, poll, cancel) is the same as
+    that of ExportJob, so that it can be polled in the same way.
+    """
+
+    def __init__(self):
+        self.fname = None
+        self.status = 'idle'  # idle | running | done | failed | cancelled
+        self._process = None
+        self.reset()
+
+    def reset(self):
+        """Forget what was sent: the next export sends the whole tree."""
+        self._assys = None   # k = assy uid, v = (name, loc tuple, parent uid)
+        self._parts = {}     # k = part uid, v = (shape, (name, color tuple, parent uid, key))
+        # (shape: a located copy, or (DeferredShape, loc tuple) for deferred parts)
+        self._keyUsers = {}  # k = shape key, v = number of parts using it
+
+    def isRunning(self):
+        return self.status == 'running'
+
+    def export(self, fname, tree):
+        """Start exporting tree to fname. Return number of parts sent."""
+        if self._process is None:
+            context = multiprocessing.get_context('spawn')
+            self._commands = context.Queue()
+            self._queue = context.Queue()
+            self._process = context.Process(target=runExportServer,
+                                            args=(self._commands, self._queue),
+                                            daemon=True)
+            self._process.start()
+            self.reset()
+        assys = {}
+        parts = {}
+        for node in tree.all_nodes_itr():
+            data = node.data
+            if data['a']:
+                assys[node.identifier] = (node.tag, shapeio.locToTuple(data['l']),
+                                          node.bpointer)
+            elif data['s'] is not None:
+                shape = data['s']
+                if isinstance(shape, DeferredShape):
+                    # Compared by identity and location, without loading it
+                    shape = (shape, shapeio.locToTuple(shape.location()))
+                else:
+                    # A copy, as parts may be moved in place (shape.Move)
+                    shape = shape.Located(shape.Location())
+                parts[node.identifier] = (shape,
+                                          (node.tag, shapeio.colorToTuple(data['c']),
+                                           node.bpointer,
+                                           shapeKey(node.identifier, data)))
+        if assys != self._assys:
+            command = ('full', fname, stepXD.treeToRecords(tree))
+            self._keyUsers = {}
+            for shape, attrs in parts.values():
+                key = attrs[3]
+                self._keyUsers[key] = self._keyUsers.get(key, 0) + 1
+            nSent = len(parts)
+        else:
+            changed = [uid for uid, (shape, attrs) in parts.items()
+                       if uid not in self._parts
+                       or self._parts[uid][1] != attrs
+                       or not sameShape(self._parts[uid][0], shape)]
+            removed = [uid for uid in self._parts
+                       if uid not in parts] + [uid for uid in changed
+                                               if uid in self._parts]
+            for uid in removed:
+                key = self._parts[uid][1][3]
+                self._keyUsers[key] -= 1
+                if not self._keyUsers[key]:
+                    del self._keyUsers[key]
+            added = []
+            for uid in changed:
+                shape, (name, color, parentUid, key) = parts[uid]
+                if isinstance(shape, tuple):
+                    shape, loc = shape
+                else:
+                    loc = shapeio.locToTuple(shape.Location())
+                shapeBytes = None
+                if key not in self._keyUsers:  # the worker doesn't have it
+                    if isinstance(shape, DeferredShape):
+                        shapeBytes = shape.peek(unlocatedBytes)
+                    else:
+                        shapeBytes = unlocatedBytes(shape)
+                self._keyUsers[key] = self._keyUsers.get(key, 0) + 1
+                added.append((uid, parentUid, name, color, key, loc, shapeBytes))
+            command = ('delta', fname, (removed, added))
+            nSent = len(set(changed).union(removed))
+        self._assys = assys
+        self._parts = parts
+        self._commands.put(command)
+        self.fname = fname
+        self.status = 'running'
+        return nSent
+
+    def poll(self):
+        """Return list of messages received since last poll."""
+        messages = []
+        if self._process is None:
+            return messages
+        while True:
+            try:
+                messages.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for kind, text in messages:
+            if kind == 'done':
+                self.status = 'done'
+            elif kind == 'error':
+                self.status = 'failed'
+                self.reset()
+        if not self._process.is_alive():
+            if self.isRunning():
+                self.status = 'failed'
+                messages.append(('error', "Export process exited with code %s"
+                                 % self._process.exitcode))
+            self._process = None
+            self.reset()
+        return messages
+
+    def cancel(self):
+        if not self.isRunning():
+            return
+        self._process.terminate()
+        self._process.join()
+        self._process = None
+        self.reset()
+        self.status = 'cancelled'
+        discard(tmpName(self.fname))
+
+
+def runExportServer(commands, messages):
+    """Serve the commands of an IncrementalExport, until None is received.
+
+    Commands are ('full', fname, records) or ('delta', fname, (removed,
+    added)), where removed is a list of part uids and added a list of
+    (uid, parentUid, name, color tuple, key, loc tuple, shape bytes or None)."""
+    sessionDoc = None
+    while True:
+        command = commands.get()
+        if command is None:
+            return
+        kind, fname, payload = command
+        try:
+            if kind == 'full':
+                messages.put(('progress', "Building document"))
+                sessionDoc = SessionDoc()
+                sessionDoc.addTree(stepXD.recordsToTree(payload))
+            else:
+                removed, added = payload
+                messages.put(('progress', "Updating %i parts"
+                              % len(set(removed) | {rec[0] for rec in added})))
+                for uid in removed:
+                    sessionDoc.removePart(uid)
+                for uid, parentUid, name, color, key, loc, shapeBytes in added:
+                    shape = None
+                    if shapeBytes is not None:
+                        shape = shapeio.shapeFromBytes(shapeBytes)
+                    sessionDoc.addPart(uid, parentUid, name,
+                                       shapeio.colorFromTuple(color), key,
+                                       shapeio.locFromTuple(loc) or TopLoc_Location(),
+                                       shape)
+        except Exception as e:
+            sessionDoc = None  # no longer in step with the caller
+            messages.put(('error', "Unable to save %s: %s" % (fname, e)))
+            continue
+        if not export(lambda f: sessionDoc.write(f, messages), fname, messages):
+            sessionDoc = None
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#
+# Copyright 2020 Doug Blanding (dblanding@gmail.com)
+#
+# This file is part of cadViewer.
+# The latest  version of this file can be found at:
+# //https://github.com/dblanding/cadviewer
+#
+# cadViewer is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# cadViewer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# if not, write to the Free Software Foundation, Inc.
+# 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+"""Import STEP files without the GUI (no QApplication is created).
+
+Each file is imported with stepXD.StepImporter, exactly as cadViewer
+would import it. Then, for each file, optionally:
+  print its assembly tree (--tree),
+  write the BRep of each of its parts to a directory (--brep-dir),
+and finally print the per-phase timings of every import, optionally
+saving them as JSON (--json).
+
+Imports go through a StepCache (--cache-dir, by default the one used by
+cadViewer), so running this overnight pre-warms the cache. A cache
+directory populated this way can also be copied to other machines.
+Use --no-cache to measure uncached import throughput.
+
+usage: python stepIngest.py [options] file.stp [file.stp ...]
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import os.path
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from OCC.Core.BRepTools import breptools_Write
+from instrumentation import ImportStats
+from partdict import DeferredShape
+import stepCache
+import stepXD
+
+logger = logging.getLogger(__name__)
+
+
+def ingest(fname, cache=None, tracing=False):
+    """Import fname in this process. Return (tree, ImportStats)."""
+    importer = stepXD.StepImporter(fname, cache=cache, tracing=tracing)
+    return importer.tree, importer.stats
+
+def fromWorker(result):
+    """Return (tree, ImportStats) from result of stepXD.importStepFile.
+
+    (which is run in a worker process, as OCC objects can't be pickled)"""
+    records, statsDict = result
+    stats = ImportStats.fromDict(statsDict)
+    with stats.phase('tree build'):
+        tree = stepXD.recordsToTree(records)
+    return tree, stats
+
+def printTree(tree, out=sys.stdout):
+    """Print tree indented by level: uid, name and node type."""
+    if tree.root is None:
+        return
+    levels = {}  # k = uid, v = level
+    for uid in tree.expand_tree(mode=tree.DEPTH, sorting=False):
+        node = tree.get_node(uid)
+        parentUid = node.bpointer
+        level = 0 if parentUid is None else levels[parentUid] + 1
+        levels[uid] = level
+        if node.data['a']:
+            kind = 'assy'
+        elif node.data.get('p', uid) != uid:
+            kind = 'part (instance of %i)' % node.data['p']
+        else:
+            kind = 'part'
+        out.write("%s%i %s [%s]\n" % ('  ' * level, uid, node.tag, kind))
+
+def writeBreps(tree, dirname):
+    """Write the shape of each part of tree to dirname/<uid>_<name>.brep
+
+    The shape is written located, as it is in the assembly.
+    Return the number of files written."""
+    os.makedirs(dirname, exist_ok=True)
+    n = 0
+    for node in tree.all_nodes_itr():
+        shape = node.data['s']
+        if node.data['a'] or shape is None:
+            continue
+        if isinstance(shape, DeferredShape):
+            shape = shape.shape()
+        safeName = re.sub(r'[^\w.-]+', '_', node.tag) or 'part'
+        path = os.path.join(dirname, "%i_%s.brep" % (node.identifier, safeName))
+        breptools_Write(shape, path)
+        n += 1
+    return n
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('files', nargs='+', help="STEP files to import")
+    parser.add_argument('--tree', action='store_true',
+                        help="print the assembly tree of each file")
+    parser.add_argument('--brep-dir', metavar='DIR',
+                        help="write parts as BRep files to DIR/<file name>/")
+    parser.add_argument('--json', metavar='FILE',
+                        help="save the import reports to FILE as JSON")
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        default=stepCache.DEFAULT_CACHE_DIR,
+                        help="STEP cache to use (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="neither read nor write the STEP cache")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="number of files imported concurrently")
+    parser.add_argument('--trace', action='store_true',
+                        help="record the per-component trace of each import")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    cache = None if args.no_cache else stepCache.StepCache(args.cache_dir)
+    reports = []
+    failures = 0
+    start = time.perf_counter()
+    if args.jobs > 1:
+        # 'spawn' gives workers a fresh interpreter, as in loadStepBatch
+        context = multiprocessing.get_context('spawn')
+        executor = ProcessPoolExecutor(max_workers=args.jobs, mp_context=context)
+        results = [executor.submit(stepXD.importStepFile, fname, cache, args.trace)
+                   for fname in args.files]
+    else:
+        executor = None
+        results = args.files
+    for fname, result in zip(args.files, results):
+        try:
+            if executor:
+                tree, stats = fromWorker(result.result())
+            else:
+                tree, stats = ingest(fname, cache, args.trace)
+        except Exception as e:
+            logger.error("Unable to import %s: %s", fname, e)
+            failures += 1
+            continue
+        if args.tree:
+            print(fname)
+            printTree(tree)
+        if args.brep_dir:
+            stem = os.path.splitext(os.path.basename(fname))[0]
+            with stats.phase('BRep write'):
+                n = writeBreps(tree, os.path.join(args.brep_dir, stem))
+            stats.setCount('BRep files', n)
+        print(stats.report())
+        reports.append(stats)
+    if executor:
+        executor.shutdown()
+    elapsed = time.perf_counter() - start
+    print("Imported %i of %i files in %.3f s (%.2f files/s)"
+          % (len(reports), len(args.files), elapsed,
+             len(reports) / elapsed if elapsed else 0.))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([stats.asDict() for stats in reports], f, indent=2)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,33 +23,110 @@
 
 
 import logging
+import multiprocessing
+import os
 import os.path
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 import treelib
+from instrumentation import ImportStats
+import shapeio
+from partdict import DeferredShape
 from treemodel import TreeModel
 from OCC.Core.IFSelect import IFSelect_RetDone
 from OCC.Core.Quantity import Quantity_Color
 from OCC.Core.STEPCAFControl import STEPCAFControl_Reader
-from OCC.Core.TDF import TDF_Label, TDF_LabelSequence
+from OCC.Core.TDF import TDF_Label, TDF_LabelSequence, TDF_Tool_Label
 from OCC.Core.TopLoc import TopLoc_Location
 from OCC.Core.XCAFDoc import XCAFDoc_ColorSurf
 from OCC.Extend.TopologyUtils import TopologyExplorer
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG) # set to DEBUG | INFO | ERROR
+logger.setLevel(logging.INFO) # set to DEBUG | INFO | ERROR
+# Per-component detail is recorded by an opt-in trace (see ImportStats)
+
+# Options passed to STEPCAFControl_Reader (also part of the cache key)
+READER_OPTIONS = {'ColorMode': True,
+                  'LayerMode': True,
+                  'NameMode': True,
+                  'MatMode': True}
+RECORDS_VERSION = 2  # format of treeToRecords (also part of the cache key)
+
+# What is needed to know about a referred label (memoized by StepImporter)
+RefInfo = namedtuple('RefInfo', 'name isSimpleShape isAssembly color shape')
+
+
+class LazyShape(DeferredShape):
+    """Instance of a shape in an XCAF document, extracted on first use.
+
+    Only the entry (as from EntryDumpToString) of the label of the referred
+    shape and the location of the instance are stored."""
+
+    def __init__(self, doc, shape_tool, entry, loc=None):
+        DeferredShape.__init__(self)
+        self.doc = doc
+        self.shape_tool = shape_tool
+        self.entry = entry
+        self.loc = loc
+
+    def load(self):
+        label = TDF_Label()
+        TDF_Tool_Label(self.doc.GetData(), self.entry, label)
+        shape = self.shape_tool.GetShape(label)
+        self._baseLoc = shape.Location()
+        if self.loc is not None:
+            shape = shape.Moved(self.loc)
+        return shape
+
+    def source(self):
+        return (id(self.doc), self.entry)
+
+    def release(self):
+        if self.isLoaded():
+            # The part may have been moved in place (shape.Move)
+            self.loc = self._shape.Location().Multiplied(self._baseLoc.Inverted())
+        DeferredShape.release(self)
+
 
 class StepImporter():
     """Read .stp file, and create a TDocStd_Document OCAF document.
 
     Also, convert OCAF doc to a (disposable) treelib.Tree() structure.
+    If a stepCache.StepCache is supplied, the tree is served from the
+    cache when the file has been imported before (in which case there is
+    no OCAF document and self.doc is None).
+    If incremental is True, nothing is imported on instantiation. Instead,
+    the caller drives the import by iterating over self.iterNodes(), and
+    is free to stop partway.
+    If lazy is True, the tree holds a LazyShape (rather than a TopoDS_Shape)
+    for each part of an assembly, so no part geometry is extracted until it
+    is needed. Lazy imports bypass the cache.
+    Phase times and counters of the import are collected in self.stats
+    (see ImportStats). If tracing is True, the detail of each component
+    is recorded there too.
+
+    Parts of an assembly which are instances of the same referred shape
+    share its TShape. The data of each such part has an extra key 'p',
+    the uid of the first instance (the 'prototype') of its shape.
     """
-    def __init__(self, filename, nextUID=0):
+    def __init__(self, filename, nextUID=0, cache=None, incremental=False,
+                 lazy=False, tracing=False):
 
         self.filename = filename
         self.tree = treelib.tree.Tree()  # 'disposable' ass'y structure
         self._currentUID = nextUID
-        self.assyUidStack = [0]
-        self.assyLocStack = []
-        self.doc = self.read_file()  # TDocStd_Document
+        self.prototypes = {}  # k = referred label entry, v = prototype uid
+        self._refMemo = {}    # k = referred label entry, v = RefInfo
+        self.memoHits = 0
+        self.memoMisses = 0
+        self.cache = None if lazy else cache
+        self.lazy = lazy
+        self.doc = None  # TDocStd_Document
+        self.stats = ImportStats(os.path.basename(filename), tracing)
+        if not incremental:
+            for node in self.iterNodes():
+                pass
 
     def getNewUID(self):
         """Dispense a series of sequential integers as uids.
@@ -65,77 +142,143 @@ class StepImporter():
         return label.GetLabelName()
 
     def getColor(self, shape):
-        # Get the part color
+        # Get the part color (shape may also be the label of the shape)
         #string_seq = self.layer_tool.GetObject().GetLayers(shape)
         color = Quantity_Color()
         self.color_tool.GetColor(shape, XCAFDoc_ColorSurf, color)
-        logger.debug("color: %i, %i, %i", color.Red(), color.Green(), color.Blue())
+        if self.stats.tracing:
+            self.stats.trace("color: %.3f, %.3f, %.3f",
+                             color.Red(), color.Green(), color.Blue())
         return color
 
-    def findComponents(self, label, comps):
+    def componentColor(self, cLabel, refInfo):
+        """Return color set on component label cLabel, else refInfo.color.
+
+        Instances of one shape may differ in color, so the color of the
+        component overrides that of the (memoized) referred shape."""
+        color = Quantity_Color()
+        if self.color_tool.GetColor(cLabel, XCAFDoc_ColorSurf, color):
+            return color
+        return refInfo.color
+
+    def getRefInfo(self, refLabel, refLabelEntry):
+        """Return RefInfo (name, isSimpleShape, isAssembly, color, shape)
+
+        of the referred label. Instances of the same shape all refer to the
+        same label, so the result is memoized (per import) by label entry.
+        The shape is None if the referred label is not a simple shape, or
+        if this is a lazy import."""
+        info = self._refMemo.get(refLabelEntry)
+        if info is not None:
+            self.memoHits += 1
+            return info
+        self.memoMisses += 1
+        name = self.getName(refLabel)
+        isSimpleShape = self.shape_tool.IsSimpleShape(refLabel)
+        isAssembly = not isSimpleShape and self.shape_tool.IsAssembly(refLabel)
+        color = shape = None
+        if isSimpleShape:
+            if self.lazy:
+                color = self.getColor(refLabel)
+            else:
+                shape = self.shape_tool.GetShape(refLabel)
+                color = self.getColor(shape)
+        info = RefInfo(name, isSimpleShape, isAssembly, color, shape)
+        self._refMemo[refLabelEntry] = info
+        return info
+
+    def memoSummary(self):
+        """Return a one line summary of referred label memo statistics."""
+        lookups = self.memoHits + self.memoMisses
+        rate = 100. * self.memoHits / lookups if lookups else 0.
+        return ("Referred label lookups: %i (%i distinct), hit rate %.1f%%"
+                % (lookups, self.memoMisses, rate))
+
+    def findComponents(self, label, comps, assyUID, assyLoc):
         """Discover components from comps (LabelSequence) of an assembly (label).
 
         Components of an assembly are, by definition, references which refer to
         either a shape or another assembly. Components are essentially 'instances'
         of the referred shape or assembly, and carry a location vector specifing
         the location of the referred shape or assembly.
+        assyUID is the uid of the assembly and assyLoc its cumulative location.
+        This is a generator, yielding each tree node as it is created.
+
+        Sub-assemblies are walked depth first using an explicit stack (not
+        recursion), so there is no limit on the depth of nesting. Each level
+        of the stack holds the cumulative location of its assembly, so every
+        part is placed with a single location, however deep it is.
         """
-        logger.debug("")
-        logger.debug("Finding components of label entry %s)", label.EntryDumpToString())
-        for j in range(comps.Length()):
-            logger.debug("loop %i of %i", j+1, comps.Length())
-            cLabel = comps.Value(j+1)  # component label <class 'OCC.Core.TDF.TDF_Label'>
-            cShape = self.shape_tool.GetShape(cLabel)
-            logger.debug("Component number %i", j+1)
-            logger.debug("Component entry: %s", cLabel.EntryDumpToString())
+        trace = self.stats.tracing  # test before tracing, to cost nothing if off
+        if trace:
+            self.stats.trace("Finding components of label entry %s", label.EntryDumpToString())
+        # Each level: [comps, index of next component, assy uid, cumulative loc]
+        stack = [[comps, 1, assyUID, assyLoc]]
+        while stack:
+            level = stack[-1]
+            comps, j, assyUID, assyLoc = level
+            if j > comps.Length():
+                stack.pop()
+                continue
+            level[1] = j + 1
+            cLabel = comps.Value(j)  # component label <class 'OCC.Core.TDF.TDF_Label'>
             name = self.getName(cLabel)
-            logger.debug("Component name: %s", name)
+            if trace:
+                self.stats.trace("Component %i of %i, entry %s: %s", j, comps.Length(),
+                                 cLabel.EntryDumpToString(), name)
             refLabel = TDF_Label()  # label of referred shape (or assembly)
             isRef = self.shape_tool.GetReferredShape(cLabel, refLabel)
             if isRef:  # I think all components are references, but just in case...
-                refShape = self.shape_tool.GetShape(refLabel)
                 refLabelEntry = refLabel.EntryDumpToString()
-                logger.debug("Entry referred to: %s", refLabelEntry)
-                refName = self.getName(refLabel)
-                logger.debug("Name of referred item: %s", refName)
-                if self.shape_tool.IsSimpleShape(refLabel):
-                    logger.debug("Referred item is a Shape")
-                    logger.debug("Name of Shape: %s", refName)
-                    tempAssyLocStack = list(self.assyLocStack)
-                    tempAssyLocStack.reverse()
-
-                    for loc in tempAssyLocStack:
-                        cShape.Move(loc)
-
-                    color = self.getColor(refShape)
-                    self.tree.create_node(name,
-                                          self.getNewUID(),
-                                          self.assyUidStack[-1],
-                                          {'a': False, 'l': None, 'c': color, 's': cShape})
-                elif self.shape_tool.IsAssembly(refLabel):
-                    logger.debug("Referred item is an Assembly")
-                    logger.debug("Name of Assembly: %s", refName)
+                if trace:
+                    self.stats.trace("Entry referred to: %s", refLabelEntry)
+                refInfo = self.getRefInfo(refLabel, refLabelEntry)
+                refName = refInfo.name
+                if trace:
+                    self.stats.trace("Name of referred item: %s", refName)
+                if refInfo.isSimpleShape:
+                    if trace:
+                        self.stats.trace("Referred item is a Shape")
+                        self.stats.trace("Name of Shape: %s", refName)
+                    # All instances share the TShape of the referred shape,
+                    # each carrying its own (composed) location.
+                    loc = assyLoc.Multiplied(self.shape_tool.GetLocation(cLabel))
+                    if self.lazy:
+                        cShape = LazyShape(self.doc, self.shape_tool,
+                                           refLabelEntry, loc)
+                    else:
+                        cShape = refInfo.shape.Moved(loc)
+                    color = self.componentColor(cLabel, refInfo)
+                    uid = self.getNewUID()
+                    protoUID = self.prototypes.setdefault(refLabelEntry, uid)
+                    yield self.tree.create_node(name,
+                                                uid,
+                                                assyUID,
+                                                {'a': False, 'l': None, 'c': color,
+                                                 's': cShape, 'p': protoUID})
+                elif refInfo.isAssembly:
+                    if trace:
+                        self.stats.trace("Referred item is an Assembly")
+                        self.stats.trace("Name of Assembly: %s", refName)
                     name = self.getName(cLabel)  # Instance name
                     aLoc = TopLoc_Location()
                     # Location vector is carried by component
                     aLoc = self.shape_tool.GetLocation(cLabel)
-                    self.assyLocStack.append(aLoc)
                     newAssyUID = self.getNewUID()
-                    self.tree.create_node(name,
-                                          newAssyUID,
-                                          self.assyUidStack[-1],
-                                          {'a': True, 'l': aLoc, 'c': None, 's': None})
-                    self.assyUidStack.append(newAssyUID)
+                    yield self.tree.create_node(name,
+                                                newAssyUID,
+                                                assyUID,
+                                                {'a': True, 'l': aLoc, 'c': None, 's': None})
                     rComps = TDF_LabelSequence() # Components of Assy
                     subchilds = False
                     isAssy = self.shape_tool.GetComponents(refLabel, rComps, subchilds)
-                    logger.debug("Assy name: %s", name)
-                    logger.debug("Is Assembly? %s", isAssy)
-                    logger.debug("Number of components: %s", rComps.Length())
+                    if trace:
+                        self.stats.trace("Assy name: %s", name)
+                        self.stats.trace("Is Assembly? %s", isAssy)
+                        self.stats.trace("Number of components: %s", rComps.Length())
                     if rComps.Length():
-                        self.findComponents(refLabel, rComps)
-        self.assyUidStack.pop()
-        self.assyLocStack.pop()
+                        stack.append([rComps, 1, newAssyUID,
+                                      assyLoc.Multiplied(aLoc)])
 
     def read_file(self):
         """Build tree = treelib.Tree() to facilitate displaying the CAD model and
@@ -145,22 +288,94 @@ class StepImporter():
         (Name, UID, ParentUID, {Data}) where the Data keys are:
         'a' (isAssy?), 'l' (TopLoc_Location), 'c' (Quantity_Color), 's' (TopoDS_Shape)
         """
+        self.read_doc()
+        with self.stats.phase('traversal'):
+            for node in self.traverse():
+                pass
+        self.countNodes()
+        return self.doc  # <class 'OCC.Core.TDocStd.TDocStd_Document'>
+
+    def iterNodes(self):
+        """Generator yielding the nodes of self.tree as they are created.
+
+        Parents are always yielded before their children. If self.cache
+        holds the file, the nodes come from there. Otherwise the file is
+        read, and its tree is stored in the cache once it is complete."""
+        nextUID = self._currentUID
+        stats = self.stats
+        if self.cache is not None:
+            with stats.phase('cache read'):
+                key = self.cache.key(self.filename,
+                                     dict(READER_OPTIONS, records=RECORDS_VERSION))
+                records = self.cache.get(key)
+            if records is not None:
+                with stats.phase('tree build'):
+                    self.tree = recordsToTree(records, nextUID)
+                self.countNodes()
+                if records:
+                    self._currentUID = max(rec[1] for rec in records) + nextUID
+                    for uid in self.tree.expand_tree(mode=self.tree.DEPTH):
+                        yield self.tree.get_node(uid)
+                return
+        self.read_doc()
+        # Only time spent in traverse() counts, not time spent by the caller
+        nodes = self.traverse()
+        while True:
+            start = time.perf_counter()
+            node = next(nodes, None)
+            stats.addTime('traversal', time.perf_counter() - start)
+            if node is None:
+                break
+            yield node
+        self.countNodes()
+        if self.cache is not None:
+            with stats.phase('cache write'):
+                self.cache.put(key, treeToRecords(self.tree, nextUID))
+
+    def countNodes(self):
+        """Set node counters of self.stats from the (complete) tree."""
+        assemblies = instances = 0
+        protoUIDs = set()
+        for node in self.tree.all_nodes_itr():
+            if node.data['a']:
+                assemblies += 1
+            elif 'p' in node.data:
+                instances += 1
+                protoUIDs.add(node.data['p'])
+        stats = self.stats
+        stats.setCount('nodes', len(self.tree))
+        stats.setCount('assemblies', assemblies)
+        stats.setCount('instances', instances)
+        stats.setCount('prototypes', len(protoUIDs))
+        if self.memoHits or self.memoMisses:
+            stats.setCount('labels', self.memoHits + self.memoMisses)
+            stats.setCount('distinct labels', self.memoMisses)
+
+    def read_doc(self):
+        """Read STEP file into a new OCAF document (self.doc)."""
         logger.info("Reading STEP file")
         tmodel = TreeModel("STEP")
         self.shape_tool = tmodel.shape_tool
         self.color_tool = tmodel.color_tool
 
         step_reader = STEPCAFControl_Reader()
-        step_reader.SetColorMode(True)
-        step_reader.SetLayerMode(True)
-        step_reader.SetNameMode(True)
-        step_reader.SetMatMode(True)
+        step_reader.SetColorMode(READER_OPTIONS['ColorMode'])
+        step_reader.SetLayerMode(READER_OPTIONS['LayerMode'])
+        step_reader.SetNameMode(READER_OPTIONS['NameMode'])
+        step_reader.SetMatMode(READER_OPTIONS['MatMode'])
 
-        status = step_reader.ReadFile(self.filename)
+        with self.stats.phase('ReadFile'):
+            status = step_reader.ReadFile(self.filename)
         if status == IFSelect_RetDone:
             logger.info("Transfer doc to STEPCAFControl_Reader")
-            step_reader.Transfer(tmodel.doc)
+            with self.stats.phase('Transfer'):
+                step_reader.Transfer(tmodel.doc)
+        self.doc = tmodel.doc
+
+    def traverse(self):
+        """Build self.tree from self.doc (see read_file).
 
+        This is a generator, yielding each tree node as it is created."""
         labels = TDF_LabelSequence()
         self.shape_tool.GetShapes(labels)
         logger.info('Number of labels at root : %i', labels.Length())
@@ -178,15 +393,13 @@ class StepImporter():
             # there is no need to examine other labels at root explicitly.
             topLoc = TopLoc_Location()
             topLoc = self.shape_tool.GetLocation(rootlabel)
-            self.assyLocStack.append(topLoc)
             entry = rootlabel.EntryDumpToString()
             logger.debug("Entry: %s", entry)
             logger.debug("Top assy name: %s", name)
             # Create root node for top assy
             newAssyUID = self.getNewUID()
-            self.tree.create_node(name, newAssyUID, None,
-                                  {'a': True, 'l': None, 'c': None, 's': None})
-            self.assyUidStack.append(newAssyUID)
+            yield self.tree.create_node(name, newAssyUID, None,
+                                        {'a': True, 'l': None, 'c': None, 's': None})
             topComps = TDF_LabelSequence() # Components of Top Assy
             subchilds = False
             isAssy = self.shape_tool.GetComponents(rootlabel, topComps, subchilds)
@@ -194,15 +407,17 @@ class StepImporter():
             logger.debug("Number of components: %s", topComps.Length())
             logger.debug("Is Reference? %s", self.shape_tool.IsReference(rootlabel))
             if topComps.Length():
-                self.findComponents(rootlabel, topComps)
+                yield from self.findComponents(rootlabel, topComps,
+                                               newAssyUID, topLoc)
+            logger.info(self.memoSummary())
         else:
             # Labels at root can hold solids or compounds (which are 'crude' assemblies)
             # Either way, we will need to create a root node in self.tree
             newAssyUID = self.getNewUID()
-            self.tree.create_node(os.path.basename(self.filename),
-                                  newAssyUID, None,
-                                  {'a': True, 'l': None, 'c': None, 's': None})
-            self.assyUidStack = [newAssyUID]
+            yield self.tree.create_node(os.path.basename(self.filename),
+                                        newAssyUID, None,
+                                        {'a': True, 'l': None, 'c': None, 's': None})
+            rootUID = newAssyUID
             for j in range(labels.Length()):
                 label = labels.Value(j+1)
                 name = self.getName(label)
@@ -224,21 +439,164 @@ class StepImporter():
                     newAssyUID = self.getNewUID()
                     for i, solid in enumerate(topo.solids()):
                         name = "P%s" % str(i+1)
-                        self.tree.create_node(name, self.getNewUID(),
-                                              self.assyUidStack[-1],
-                                              {'a': False, 'l': None,
-                                               'c': color, 's': solid})
+                        yield self.tree.create_node(name, self.getNewUID(),
+                                                    rootUID,
+                                                    {'a': False, 'l': None,
+                                                     'c': color, 's': solid})
                 elif shapeType == 2:
                     logger.debug("The shape type is OCC.Core.TopAbs.TopAbs_SOLID")
-                    self.tree.create_node(name, self.getNewUID(),
-                                          self.assyUidStack[-1],
-                                          {'a': False, 'l': None,
-                                           'c': color, 's': shape})
+                    yield self.tree.create_node(name, self.getNewUID(),
+                                                rootUID,
+                                                {'a': False, 'l': None,
+                                                 'c': color, 's': shape})
                 elif shapeType == 3:
                     logger.debug("The shape type is OCC.Core.TopAbs.TopAbs_SHELL")
-                    self.tree.create_node(name, self.getNewUID(),
-                                          self.assyUidStack[-1],
-                                          {'a': False, 'l': None,
-                                           'c': color, 's': shape})
+                    yield self.tree.create_node(name, self.getNewUID(),
+                                                rootUID,
+                                                {'a': False, 'l': None,
+                                                 'c': color, 's': shape})
+
+
+#############################################
+#
+# Transfer of import results between processes
+#
+#############################################
+
+def treeToRecords(tree, uidOffset=0):
+    """Flatten tree (built by StepImporter) to a list of picklable records.
+
+    Records are (name, uid, parentUid, data) tuples in depth-first order,
+    so parents always precede their children. The OCC objects in data are
+    replaced by their shapeio equivalents. uidOffset is subtracted from
+    every uid (and parent uid), the inverse of recordsToTree().
+    The shape of a prototype (data['p']) is serialized only once, with
+    the first of its instances ('ps'). Each instance then records only its
+    location ('sl'). Deferred shapes (see partdict.DeferredShape) which
+    had to be loaded are released again once serialized."""
+    records = []
+    if tree.root is None:
+        return records
+    protoUIDs = set()  # prototypes already serialized
+    for uid in tree.expand_tree(mode=tree.DEPTH):
+        node = tree.get_node(uid)
+        data = node.data
+        shape = data['s']
+        deferred = None
+        if isinstance(shape, DeferredShape):
+            # Released again below, unless it was loaded already
+            deferred = shape if not shape.isLoaded() else None
+            shape = shape.shape()
+        parentUid = node.bpointer
+        if parentUid is not None:
+            parentUid -= uidOffset
+        record = {'a': data['a'],
+                  'l': shapeio.locToTuple(data['l']),
+                  'c': shapeio.colorToTuple(data['c']),
+                  's': None}
+        protoUID = data.get('p')
+        if protoUID is None:
+            if shape:
+                record['s'] = shapeio.shapeToBytes(shape)
+        else:
+            record['p'] = protoUID - uidOffset
+            record['sl'] = shapeio.locToTuple(shape.Location())
+            if protoUID not in protoUIDs:
+                protoUIDs.add(protoUID)
+                record['ps'] = shapeio.shapeToBytes(shape.Located(TopLoc_Location()))
+        if deferred is not None:
+            deferred.release()
+        records.append((node.tag, uid - uidOffset, parentUid, record))
+    return records
+
+def recordsToTree(records, uidOffset=0):
+    """Rebuild a treelib.Tree from records made by treeToRecords().
+
+    Every uid (and parent uid) is increased by uidOffset, allowing trees
+    imported independently to be merged without uid collisions.
+    Instances of the same prototype share one TShape again."""
+    tree = treelib.tree.Tree()
+    protoShapes = {}  # k = prototype uid, v = TopoDS_Shape (not located)
+    for name, uid, parentUid, record in records:
+        if parentUid is not None:
+            parentUid += uidOffset
+        data = {'a': record['a'],
+                'l': shapeio.locFromTuple(record['l']),
+                'c': shapeio.colorFromTuple(record['c']),
+                's': None}
+        if 'p' in record:
+            protoUID = record['p'] + uidOffset
+            if 'ps' in record:
+                protoShapes[protoUID] = shapeio.shapeFromBytes(record['ps'])
+            loc = shapeio.locFromTuple(record['sl']) or TopLoc_Location()
+            data['s'] = protoShapes[protoUID].Located(loc)
+            data['p'] = protoUID
+        elif record['s']:
+            data['s'] = shapeio.shapeFromBytes(record['s'])
+        tree.create_node(name, uid + uidOffset, parentUid, data)
+    return tree
+
+def importStepFile(filename, cache=None, tracing=False):
+    """Import filename and return (records, stats) of its tree.
+
+    records: see treeToRecords; stats: ImportStats.asDict().
+    Intended to be run in a worker process. The uids of the returned
+    records start at 1; the caller is responsible for offsetting them."""
+    stepImporter = StepImporter(filename, cache=cache, tracing=tracing)
+    with stepImporter.stats.phase('records'):
+        records = treeToRecords(stepImporter.tree)
+    return records, stepImporter.stats.asDict()
+
+
+class ImportBatch():
+    """Several STEP files imported at once, each in its own worker process.
+
+    The files are parsed and transferred concurrently by a pool of worker
+    processes (see importStepFile). The caller collects the outcome by
+    polling, so it never blocks waiting for a worker. Once the batch is
+    no longer running, self.results holds (records, stats dict) of each
+    file imported successfully, and self.stats the times of the batch.
+    """
+
+    def __init__(self, fnames, cache=None, tracing=False):
+        self.fnames = fnames
+        self.results = {}  # k = fname, v = (tree records, stats dict)
+        self.nDone = 0  # files done (imported or failed)
+        self.stats = ImportStats("batch of %i files" % len(fnames))
+        self._start = time.perf_counter()
+        # 'spawn' keeps Qt state out of the worker processes
+        context = multiprocessing.get_context('spawn')
+        workers = min(len(fnames), os.cpu_count() or 1)
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        self._futures = {self._executor.submit(importStepFile, fname, cache, tracing): fname
+                         for fname in fnames}  # k = future, v = fname
+
+    def isRunning(self):
+        return bool(self._futures)
+
+    def poll(self):
+        """Return list of (fname, error text or None) of files done since last poll."""
+        messages = []
+        for future in [f for f in self._futures if f.done()]:
+            fname = self._futures.pop(future)
+            self.nDone += 1
+            try:
+                self.results[fname] = future.result()
+            except Exception as e:
+                messages.append((fname, str(e)))
+            else:
+                messages.append((fname, None))
+        if not self._futures and self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+            self.stats.addTime('workers', time.perf_counter() - self._start)
+        return messages
 
-        return tmodel.doc  # <class 'OCC.Core.TDocStd.TDocStd_Document'>
+    def cancel(self):
+        """Drop the files not imported yet; those being imported still finish."""
+        if self._executor is not None:
+            for future in self._futures:
+                future.cancel()
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._futures = {}
@@ -0,0 +1,63 @@
+"""Smoke tests of AssyTreeModel / AssyTreeView (run offscreen)."""
+
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+pytest.importorskip('PyQt5')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QApplication
+from assyTreeModel import ROOT, AssyTreeModel, AssyTreeView
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def makeTree(model):
+    """Root (0) holding assy 1 (parts 2, 3) and part 4."""
+    model.addNode(0, ROOT, '/', assy=True)
+    model.addNode(1, 0, 'assy', assy=True)
+    model.addNode(2, 1, 'part2', checked=True)
+    model.addNode(3, 1, 'part3')
+    model.addNode(4, 0, 'part4', checked=True)
+
+
+def test_expand_root(app):
+    model = AssyTreeModel()
+    view = AssyTreeView()
+    view.setModel(model)
+    model.addNode(0, ROOT, '/', assy=True)
+    view.expand(model.indexOf(0))  # before the view asked for any index
+    assert model.uidOf(model.indexOf(0)) == 0
+    model.clear()
+    model.addNode(0, ROOT, '/', assy=True)
+    view.expand(model.indexOf(0))
+    assert view.isExpanded(model.indexOf(0))
+
+
+def test_check_state(app):
+    model = AssyTreeModel()
+    makeTree(model)
+    assert model.checkState(1) == Qt.PartiallyChecked
+    assert model.setChecked([3], True) == [3]
+    assert model.checkState(1) == Qt.Checked
+    changes = []
+    model.checkStateChanged.connect(lambda uids, checked: changes.append((uids, checked)))
+    model.setData(model.indexOf(1), Qt.Unchecked, Qt.CheckStateRole)
+    assert [(sorted(uids), checked) for uids, checked in changes] == [([2, 3], False)]
+    assert model.checkState(0) == Qt.PartiallyChecked
+
+
+def test_move_node(app):
+    model = AssyTreeModel()
+    makeTree(model)
+    assert model.moveNode(4, 1)
+    assert model.children(1) == [2, 3, 4]
+    assert model.parentUID(4) == 1
+    assert not model.moveNode(1, 1)  # not into itself
@@ -0,0 +1,57 @@
+"""Export a tree to STEP and import it back (needs pythonocc)."""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('OCC')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import queue
+import treelib
+from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeBox
+from OCC.Core.gp import gp_Trsf, gp_Vec
+from OCC.Core.IFSelect import IFSelect_RetDone
+from OCC.Core.Quantity import Quantity_Color, Quantity_TOC_RGB
+from OCC.Core.TopLoc import TopLoc_Location
+import stepExport
+import stepXD
+
+RED = (1.0, 0.0, 0.0)
+BLUE = (0.0, 0.0, 1.0)
+
+
+def moved(shape, dx):
+    trsf = gp_Trsf()
+    trsf.SetTranslation(gp_Vec(dx, 0, 0))
+    return shape.Located(TopLoc_Location(trsf))
+
+
+def makeTree():
+    """Assy 1 holding two instances (red, blue) of one box."""
+    box = BRepPrimAPI_MakeBox(10, 10, 10).Shape()
+    tree = treelib.tree.Tree()
+    tree.create_node('top', 1, None, {'a': True, 'l': None, 'c': None, 's': None})
+    for uid, name, rgb, dx in ((2, 'red', RED, 0), (3, 'blue', BLUE, 20)):
+        color = Quantity_Color(*rgb, Quantity_TOC_RGB)
+        tree.create_node(name, uid, 1, {'a': False, 'l': None, 'c': color,
+                                        's': moved(box, dx), 'p': 2})
+    return tree
+
+
+def rgb(color):
+    return tuple(round(v, 3) for v in (color.Red(), color.Green(), color.Blue()))
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_instance_colors(tmp_path, lazy):
+    fname = str(tmp_path / 'colors.stp')
+    doc = stepExport.SessionDoc()
+    doc.addTree(makeTree())
+    assert doc.write(fname, queue.Queue()) == IFSelect_RetDone
+
+    tree = stepXD.StepImporter(fname, lazy=lazy).tree
+    colors = {node.tag: rgb(node.data['c']) for node in tree.all_nodes()
+              if not node.data['a']}
+    assert colors == {'red': RED, 'blue': BLUE}
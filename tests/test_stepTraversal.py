@@ -0,0 +1,72 @@
+"""StepImporter.traverse() time must grow linearly with the assembly size.
+
+The assemblies are built directly in an XCAF document (no STEP file
+needed): a chain of depth nested assemblies, with the leaves (instances
+of one box) spread evenly over all levels.
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('OCC')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from OCC.Core.BRepPrimAPI import BRepPrimAPI_MakeBox
+from OCC.Core.gp import gp_Trsf, gp_Vec
+from OCC.Core.TopLoc import TopLoc_Location
+import stepXD
+from treemodel import TreeModel
+
+LEAVES = 2000  # smallest assembly; the largest has 4 times as many
+GROWTH = 4
+SLACK = 2  # allowed time per leaf, large over small (quadratic would be 4)
+
+
+def makeSyntheticAssy(depth, leaves):
+    """Return TreeModel holding a synthetic assembly (depth, leaves)."""
+    tmodel = TreeModel("Synthetic")
+    shape_tool = tmodel.shape_tool
+    # StepImporter treats the first label at root as the top assembly,
+    # so the assembly labels must be created before the box.
+    assys = [shape_tool.NewShape() for level in range(depth)]
+    box = shape_tool.AddShape(BRepPrimAPI_MakeBox(1, 1, 1).Shape(), False)
+    trsf = gp_Trsf()
+    trsf.SetTranslation(gp_Vec(2, 0, 0))
+    step = TopLoc_Location(trsf)
+    perLevel, extra = divmod(leaves, depth)
+    for level, assy in enumerate(assys):
+        loc = TopLoc_Location()
+        for i in range(perLevel + (1 if level < extra else 0)):
+            shape_tool.AddComponent(assy, box, loc)
+            loc = loc.Multiplied(step)
+        if level + 1 < depth:
+            shape_tool.AddComponent(assy, assys[level + 1], step)
+    return tmodel
+
+
+def timeTraversal(depth, leaves, repeat=3):
+    """Return (number of nodes, best time in seconds) of the traversal."""
+    tmodel = makeSyntheticAssy(depth, leaves)
+    best = None
+    for i in range(repeat):
+        importer = stepXD.StepImporter("synthetic", incremental=True)
+        importer.doc = tmodel.doc
+        importer.shape_tool = tmodel.shape_tool
+        importer.color_tool = tmodel.color_tool
+        start = time.perf_counter()
+        nodes = sum(1 for node in importer.traverse())
+        secs = time.perf_counter() - start
+        best = secs if best is None else min(best, secs)
+    return nodes, best
+
+
+@pytest.mark.parametrize('depth', [1, 50], ids=['wide', 'deep'])
+def test_linear_growth(depth):
+    nodes, small = timeTraversal(depth, LEAVES)
+    assert nodes == depth + LEAVES
+    nodes, large = timeTraversal(depth, GROWTH * LEAVES)
+    assert nodes == depth + GROWTH * LEAVES
+    assert large < GROWTH * SLACK * small
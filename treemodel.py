@@ -32,7 +32,7 @@ from OCC.Core.XCAFDoc import (XCAFDoc_DocumentTool_ShapeTool,
                               XCAFDoc_DocumentTool_MaterialTool)
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG) # set to DEBUG | INFO | ERROR
+logger.setLevel(logging.INFO) # set to DEBUG | INFO | ERROR
 
 
 class TreeModel():